@@ -0,0 +1,306 @@
+"""Run a list of business questions without the UI and write a report to disk.
+
+    python batch_report.py questions.yaml --output reports/2026-10-17
+    python batch_report.py questions.json --workers 4 --max-rows 20000
+
+The questions file (YAML or JSON) is either a list or a ``{"questions": [...]}``
+mapping; each item is a question string or ``{"name": ..., "question": ...}``.
+
+Each question goes through the same path as the chat: Cortex Analyst (via the
+shared response cache), then the generated SQL through the Dremio procedure.
+Per question the output directory gets the result as Parquet and its chart as a
+Vega-Lite spec; ``report.html`` shows every answer with its chart and
+``summary.json`` holds the timings. Analyst responses are persisted next to the
+report's parent directory, so a repeat run of the same questions against the
+same semantic model version skips Cortex Analyst.
+"""
+
+import argparse
+import html
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import streamlit_app as app
+
+DEFAULT_WORKERS = 4
+DEFAULT_CACHE_MAX_AGE_HOURS = 24
+PREVIEW_ROWS = 20
+
+@dataclass
+class BatchQuestion:
+    """One question from the input file."""
+    name: str
+    question: str
+
+@dataclass
+class BatchResult:
+    """Outcome and timings of one question."""
+    question: BatchQuestion
+    text: str = ""
+    sql: Optional[str] = None
+    error: Optional[str] = None
+    rows: int = 0
+    truncated: bool = False
+    cached_answer: bool = False
+    response_key: Optional[Tuple] = None  # response cache key the answer was looked up under
+    timings: Dict[str, float] = field(default_factory=dict)  # stage -> seconds
+    parquet_path: Optional[str] = None
+    chart_path: Optional[str] = None
+    chart: Optional[Dict[str, Any]] = None
+    preview_html: str = ""
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", help="YAML or JSON file with the questions to run")
+    parser.add_argument("--output", default="batch_output", help="Directory for the report and results")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Questions run concurrently")
+    parser.add_argument("--max-rows", type=int, default=app.RESULT_MAX_ROWS, help="Rows fetched per question")
+    parser.add_argument("--cache-file", help="Persisted analyst responses (default: <output>/../.batch_responses.json)")
+    parser.add_argument(
+        "--cache-max-age-hours", type=float, default=DEFAULT_CACHE_MAX_AGE_HOURS,
+        help="Ignore persisted responses older than this"
+    )
+    return parser.parse_args()
+
+def load_questions(path: str) -> List[BatchQuestion]:
+    """Read questions from a YAML or JSON file."""
+    with open(path) as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+        else:
+            import yaml
+            data = yaml.safe_load(f)
+    items = data.get("questions", []) if isinstance(data, dict) else data
+
+    questions = []
+    for i, item in enumerate(items or [], start=1):
+        if isinstance(item, str):
+            item = {"question": item}
+        slug = re.sub(r"[^a-z0-9]+", "-", str(item.get("name") or item["question"]).lower())[:40].strip("-")
+        questions.append(BatchQuestion(name=f"{i:02d}-{slug}", question=item["question"]))
+    return questions
+
+def load_saved_responses(path: str, max_age_seconds: float) -> Dict[str, Dict]:
+    """Persisted analyst responses younger than max_age_seconds, keyed by their JSON cache key.
+
+    Entries without a semantic model version could belong to any model version and are ignored.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        saved = json.load(f)
+    return {
+        json.dumps(entry["key"]): entry
+        for entry in saved.get("entries", [])
+        if time.time() - entry["saved_at"] < max_age_seconds and entry["key"][1] is not None
+    }
+
+def seed_response_cache(saved: Dict[str, Dict], max_age_seconds: float) -> None:
+    """Put persisted responses into the shared response cache for the rest of their lifetime."""
+    cache = app.get_response_cache()
+    for entry in saved.values():
+        remaining = max_age_seconds - (time.time() - entry["saved_at"])
+        cache.set(tuple(entry["key"]), entry["content"], ttl_seconds=remaining)
+
+def save_responses(path: str, results: List[BatchResult], saved: Dict[str, Dict]) -> None:
+    """Persist the responses used by this run; reused ones keep their original timestamp.
+
+    Responses cached before the semantic model version was known are not persisted.
+    """
+    cache = app.get_response_cache()
+    entries = dict(saved)
+    for result in results:
+        key = result.response_key
+        if key is None or key[1] is None:
+            continue
+        content = cache.get(key)
+        if content is not None and json.dumps(list(key)) not in entries:
+            entries[json.dumps(list(key))] = {"key": list(key), "content": content, "saved_at": time.time()}
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"entries": list(entries.values())}, f, default=str)
+
+def chart_to_vega_lite(spec: "app.ChartSpec", x_col: str, y_col: str) -> Dict[str, Any]:
+    """Vega-Lite JSON for a chart spec, including the kinds the app draws with native Streamlit charts."""
+    if spec.kind == "vega_lite":
+        return spec.payload
+    if spec.kind == "metric":
+        label, value = spec.payload
+        return {"metric": {"label": label, "value": value}}
+    chart = app.alt.Chart(spec.payload.reset_index())
+    chart = chart.mark_line() if spec.kind == "line" else chart.mark_bar()
+    return chart.encode(x=x_col, y=y_col).to_dict()
+
+def run_question(question: BatchQuestion, output_dir: str, max_rows: int) -> BatchResult:
+    """Answer one question and write its result files. Runs on a worker thread.
+
+    Failures are recorded on the result, so one bad question does not stop the run.
+    """
+    result = BatchResult(question)
+    started = time.perf_counter()
+    try:
+        answer_question(result, output_dir, max_rows)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.timings["total"] = time.perf_counter() - started
+    return result
+
+def answer_question(result: BatchResult, output_dir: str, max_rows: int) -> None:
+    """Fill result with the analyst answer, its query result and chart."""
+    question = result.question
+    with app.warehouse_request(None, app.PRIORITY_INTERACTIVE):
+        result.response_key = app.response_cache_key(question.question)
+        result.cached_answer = result.response_key in app.get_response_cache()
+        stage_started = time.perf_counter()
+        response_content, error = app.get_analyst_response(question.question)
+        result.timings["analyst"] = time.perf_counter() - stage_started
+        if error or not response_content:
+            result.error = f"Cortex Analyst Error: {error or 'empty response'}"
+            return
+
+        result.text = app.extract_text_from_response(response_content)
+        result.sql = app.extract_sql_from_response(response_content)
+        if not result.sql:
+            return
+
+        stage_started = time.perf_counter()
+        df, sql_error = app.call_dremio_data_procedure(result.sql, max_rows)
+        result.timings["query"] = time.perf_counter() - stage_started
+
+    if df is None:
+        result.error = sql_error
+        return
+
+    stage_started = time.perf_counter()
+    result.rows = len(df)
+    result.truncated = bool(df.attrs.get("truncated"))
+    result.preview_html = df.head(PREVIEW_ROWS).to_html(index=False, border=0, classes="preview")
+    parquet_path = os.path.join(output_dir, f"{question.name}.parquet")
+    df.to_parquet(parquet_path, engine="pyarrow", compression=app.SNAPSHOT_COMPRESSION, index=False)
+    result.parquet_path = parquet_path
+
+    if len(df.columns) >= 2 and not df.empty:
+        # Same default selection the Chart tab starts with
+        profile = app.profile_result(df)
+        x_col, y_col, chart_type = app.recommend_chart(profile)
+        if app.chart_block_reason(profile, x_col, y_col, chart_type) is None:
+            spec = app.build_chart_spec(df, x_col, y_col, chart_type)
+            result.chart = chart_to_vega_lite(spec, x_col, y_col)
+            result.chart_path = os.path.join(output_dir, f"{question.name}.vl.json")
+            with open(result.chart_path, "w") as f:
+                json.dump(result.chart, f, default=str)
+    result.timings["write"] = time.perf_counter() - stage_started
+
+def script_json(value: Any) -> str:
+    """JSON that can sit inside a <script> element, even when the data contains "</script>"."""
+    return json.dumps(value, default=str).replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+
+def write_html_report(path: str, results: List[BatchResult], wall_seconds: float) -> None:
+    """One self-contained page with every answer, its data preview and chart."""
+    sections = []
+    for i, result in enumerate(results):
+        parts = [f"<h2>{html.escape(result.question.question)}</h2>"]
+        if result.text:
+            parts.append(f"<p>{html.escape(result.text)}</p>")
+        if result.error:
+            parts.append(f'<p class="error">❌ {html.escape(result.error)}</p>')
+        if result.sql:
+            parts.append(f"<details><summary>SQL</summary><pre>{html.escape(result.sql)}</pre></details>")
+        if result.chart and "metric" in result.chart:
+            metric = result.chart["metric"]
+            parts.append(f'<p class="metric">{html.escape(str(metric["label"]))}: <b>{metric["value"]}</b></p>')
+        elif result.chart:
+            parts.append(f'<div id="chart{i}"></div><script>vegaEmbed("#chart{i}", {script_json(result.chart)});</script>')
+        if result.preview_html:
+            more = "+" if result.truncated else ""
+            parts.append(f"<p class=\"meta\">{result.rows:,}{more} rows • first {PREVIEW_ROWS} shown</p>{result.preview_html}")
+        timing = " • ".join(f"{stage} {seconds:.2f}s" for stage, seconds in result.timings.items())
+        parts.append(f'<p class="meta">⏱️ {timing}{" • cached answer" if result.cached_answer else ""}</p>')
+        sections.append("<section>" + "\n".join(parts) + "</section>")
+
+    page = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Cortex Analyst batch report</title>
+<script src="https://cdn.jsdelivr.net/npm/vega@5"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-lite@5"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-embed@6"></script>
+<style>
+body {{ font-family: sans-serif; margin: 2em auto; max-width: 1100px; }}
+section {{ border-top: 1px solid #ddd; padding: 1em 0; }}
+.meta {{ color: #666; font-size: 0.9em; }}
+.error {{ color: #b00020; }}
+table.preview {{ border-collapse: collapse; font-size: 0.85em; }}
+table.preview td, table.preview th {{ padding: 2px 8px; border-bottom: 1px solid #eee; }}
+</style></head>
+<body>
+<h1>🤖 Cortex Analyst batch report</h1>
+<p class="meta">{len(results)} questions in {wall_seconds:.1f}s • generated {time.strftime("%Y-%m-%d %H:%M:%S")}</p>
+{"".join(sections)}
+</body></html>
+"""
+    with open(path, "w") as f:
+        f.write(page)
+
+def format_summary(results: List[BatchResult], wall_seconds: float) -> str:
+    """Plain-text timing table for the console."""
+    lines = [f"{'question':<44} {'analyst':>8} {'query':>8} {'total':>8} {'rows':>9}  status"]
+    for result in results:
+        timings = result.timings
+        status = "error" if result.error else ("cached" if result.cached_answer else "ok")
+        lines.append(
+            f"{result.question.name[:44]:<44} {timings.get('analyst', 0):>7.2f}s {timings.get('query', 0):>7.2f}s "
+            f"{timings.get('total', 0):>7.2f}s {result.rows:>9,}  {status}"
+        )
+    errors = sum(1 for result in results if result.error)
+    lines.append(f"{len(results)} questions, {errors} errors, {wall_seconds:.1f}s wall time")
+    return "\n".join(lines)
+
+def main() -> None:
+    args = parse_args()
+    questions = load_questions(args.questions)
+    os.makedirs(args.output, exist_ok=True)
+    cache_file = args.cache_file or os.path.join(os.path.dirname(os.path.abspath(args.output)), ".batch_responses.json")
+    max_age_seconds = args.cache_max_age_hours * 3600
+    # Response cache keys carry the model version; read it before any key is built
+    app.get_semantic_model_watcher().poll()
+    saved = load_saved_responses(cache_file, max_age_seconds)
+    seed_response_cache(saved, max_age_seconds)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch") as executor:
+        results = list(executor.map(lambda q: run_question(q, args.output, args.max_rows), questions))
+    wall_seconds = time.perf_counter() - started
+
+    save_responses(cache_file, results, saved)
+    write_html_report(os.path.join(args.output, "report.html"), results, wall_seconds)
+    with open(os.path.join(args.output, "summary.json"), "w") as f:
+        json.dump({
+            "wall_seconds": wall_seconds,
+            "questions": [
+                {
+                    "name": result.question.name,
+                    "question": result.question.question,
+                    "sql": result.sql,
+                    "error": result.error,
+                    "rows": result.rows,
+                    "truncated": result.truncated,
+                    "cached_answer": result.cached_answer,
+                    "timings": result.timings,
+                    "parquet": result.parquet_path,
+                    "chart": result.chart_path,
+                }
+                for result in results
+            ],
+        }, f, indent=2)
+
+    print(format_summary(results, wall_seconds))
+    sys.exit(1 if any(result.error for result in results) else 0)
+
+if __name__ == "__main__":
+    main()
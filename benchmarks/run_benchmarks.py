@@ -0,0 +1,152 @@
+"""Offline benchmarks for the Cortex Analyst chat app.
+
+Runs the app against the local backend (recorded Cortex Analyst responses and a
+synthetic Dremio result), so no Snowflake account or network access is needed:
+
+    python benchmarks/run_benchmarks.py --quick
+    python benchmarks/run_benchmarks.py --rows 1000 10000 100000 1000000 --output bench_output.txt
+
+Three suites are reported:
+
+* chart build time per chart type against result size,
+* end-to-end question latency (submit to finished answer) with the configured
+  procedure latencies,
+* script rerun time against chat history length.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "streamlit_app.py")
+FIXTURES_PATH = os.path.join(ROOT, "benchmarks", "fixtures", "cortex_responses.json")
+
+CHART_AXES = {
+    "Line Chart 📈": ("CREATED_AT", "AMOUNT"),
+    "Bar Chart 📊": ("CATEGORY", "AMOUNT"),
+    "Pie Chart 🥧": ("CATEGORY", "AMOUNT"),
+    "Scatter Plot 🔵": ("QUANTITY", "AMOUNT"),
+    "Histogram 📊": ("CATEGORY", "AMOUNT"),
+    "Box Plot 📦": ("CATEGORY", "AMOUNT"),
+    "Combo Chart 🔀": ("CREATED_AT", "AMOUNT"),
+}
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="Small sizes for a fast smoke run")
+    parser.add_argument("--rows", type=int, nargs="+", help="Result sizes for the chart suite")
+    parser.add_argument("--history", type=int, help="Number of questions to ask in the chat suites")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions per measurement")
+    parser.add_argument("--cortex-latency", type=float, default=0.5, help="Simulated Cortex Analyst latency (s)")
+    parser.add_argument("--dremio-latency", type=float, default=0.2, help="Simulated Dremio latency (s)")
+    parser.add_argument("--result-rows", type=int, default=10_000, help="Rows returned by each chat query")
+    parser.add_argument("--output", help="Also write the report to this file")
+    args = parser.parse_args()
+    if args.rows is None:
+        args.rows = [1_000, 10_000] if args.quick else [1_000, 10_000, 100_000, 1_000_000]
+    if args.history is None:
+        args.history = 5 if args.quick else 30
+    if args.quick:
+        args.repeat = min(args.repeat, 3)
+    return args
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Point the app at the local backend; must run before the app is imported."""
+    os.environ.update(
+        CORTEX_APP_BACKEND="local",
+        CORTEX_APP_LOCAL_FIXTURES=FIXTURES_PATH,
+        CORTEX_APP_LOCAL_CORTEX_LATENCY=str(args.cortex_latency),
+        CORTEX_APP_LOCAL_DREMIO_LATENCY=str(args.dremio_latency),
+        CORTEX_APP_LOCAL_ROWS=str(args.result_rows),
+        # One simulated user asks questions back to back; measure the app, not the rate limit
+        CORTEX_APP_RATE_LIMIT_PER_MINUTE="0",
+    )
+
+def time_call(fn: Callable[[], object], repeat: int) -> List[float]:
+    """Wall-clock milliseconds for each of ``repeat`` calls of fn."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def format_row(label: str, samples: List[float]) -> str:
+    return (
+        f"{label:<36} median {statistics.median(samples):9.1f} ms   "
+        f"min {min(samples):9.1f} ms   max {max(samples):9.1f} ms"
+    )
+
+def bench_charts(args: argparse.Namespace) -> List[str]:
+    """Chart spec build time per chart type and result size."""
+    sys.path.insert(0, ROOT)
+    import streamlit_app as app
+
+    lines = ["Chart build time (build_chart_spec)"]
+    for rows in args.rows:
+        df = app.LocalBackend(None, cortex_latency=0, dremio_latency=0, rows=rows).synthetic_result()
+        for chart_type, (x_col, y_col) in CHART_AXES.items():
+            samples = time_call(lambda: app.build_chart_spec(df, x_col, y_col, chart_type), args.repeat)
+            lines.append(format_row(f"  {rows:>9,} rows  {chart_type}", samples))
+    return lines
+
+def bench_chat(args: argparse.Namespace) -> List[str]:
+    """End-to-end question latency and rerun time as the chat history grows."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.run()
+    questions = [
+        "What is the total opportunity amount by stage?",
+        "Show monthly sales for the last year",
+        "Which products have the lowest stock?",
+    ]
+
+    latencies: List[float] = []
+    rerun_by_history: Dict[int, List[float]] = {}
+    checkpoints = {n for n in (1, 5, 10, 20, 30, 50, 100) if n <= args.history} | {args.history}
+    for i in range(1, args.history + 1):
+        # Recorded questions first, then synthetic ones that miss the answer cache
+        question = questions[i - 1] if i <= len(questions) else f"Show amount by category, variant {i}"
+        start = time.perf_counter()
+        at.chat_input[0].set_value(question).run()
+        while at.session_state.active_job is not None:
+            time.sleep(0.02)
+            at.run()
+        latencies.append((time.perf_counter() - start) * 1000)
+        if at.exception:
+            raise RuntimeError(f"App raised while answering {question!r}: {at.exception}")
+        if i in checkpoints:
+            rerun_by_history[i] = time_call(at.run, args.repeat)
+
+    lines = [
+        "End-to-end question latency "
+        f"(Cortex {args.cortex_latency:.2f}s, Dremio {args.dremio_latency:.2f}s, {args.result_rows:,} rows)",
+        format_row(f"  {len(latencies)} questions", latencies),
+        "",
+        "Rerun time vs chat history",
+    ]
+    for turns, samples in sorted(rerun_by_history.items()):
+        lines.append(format_row(f"  {turns:>4} questions", samples))
+    return lines
+
+def main() -> None:
+    args = parse_args()
+    configure_environment(args)
+
+    report = []
+    for suite in (bench_charts, bench_chat):
+        report.extend(suite(args))
+        report.append("")
+    text = "\n".join(report)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+if __name__ == "__main__":
+    main()
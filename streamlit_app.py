@@ -1,24 +1,203 @@
+from __future__ import annotations
+
 import json
 import streamlit as st
-import pandas as pd
-from snowflake.snowpark.exceptions import SnowparkSQLException
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple, Union
-import altair as alt
-import numpy as np
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
 import re
+import contextvars
+import functools
+import gzip
 import hashlib
+import importlib
+import io
+import os
+import sys
+import tempfile
+import threading
 import time
+import uuid
+import weakref
+
+class LazyModule:
+    """Stands in for a heavy module and imports it on first attribute access.
+
+    Keeps pandas, numpy, Altair and Snowpark off the cold-start path; the time
+    each real import takes is added to the startup report.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
 
-# Snowflake connection
-cnx = st.connection("snowflake")
-session = cnx.session()
+    def __getattr__(self, attr: str) -> Any:
+        if self._module is None:
+            self._module = self._load()
+        return getattr(self._module, attr)
+
+    def _load(self):
+        already_imported = self._name in sys.modules
+        started = time.perf_counter()
+        module = importlib.import_module(self._name)
+        if not already_imported:
+            get_startup_report().record(f"import {self._name}", time.perf_counter() - started)
+        return module
+
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+alt = LazyModule("altair")
+pa = LazyModule("pyarrow")
+pq = LazyModule("pyarrow.parquet")
+snowpark_exceptions = LazyModule("snowflake.snowpark.exceptions")
 
 # Configuration
 SEMANTIC_MODEL_PATH = "CORTEX_ANALYST.CORTEX_AI.CORTEX_ANALYST_STAGE/nlp.yaml"
 CHAT_PROCEDURE = "CORTEX_ANALYST.CORTEX_AI.CORTEX_ANALYST_CHAT_PROCEDURE"
 DREMIO_PROCEDURE = "SALESFORCE_DREMIO.SALESFORCE_SCHEMA_DREMIO.DREMIO_DATA_PROCEDURE"
 
+# Warehouse backend: "snowflake", or "local" for the offline stand-in used by
+# development and benchmarks (see benchmarks/run_benchmarks.py)
+WAREHOUSE_BACKEND = os.environ.get("CORTEX_APP_BACKEND", "snowflake")
+LOCAL_FIXTURES_PATH = os.environ.get("CORTEX_APP_LOCAL_FIXTURES")
+LOCAL_CORTEX_LATENCY_SECONDS = float(os.environ.get("CORTEX_APP_LOCAL_CORTEX_LATENCY", "0.5"))
+LOCAL_DREMIO_LATENCY_SECONDS = float(os.environ.get("CORTEX_APP_LOCAL_DREMIO_LATENCY", "0.2"))
+LOCAL_RESULT_ROWS = int(os.environ.get("CORTEX_APP_LOCAL_ROWS", "1000"))
+
+# Query result cache (shared by all sessions in this process)
+RESULT_CACHE_TTL_SECONDS = 15 * 60
+RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+RESULT_CACHE_SESSION_MAX_BYTES = 64 * 1024 * 1024
+
+# Results are tagged with the tables they read and dropped when one of them changes.
+# Results whose tables all report a version keep the longer TTL below.
+TABLE_FRESHNESS_POLL_SECONDS = 60
+TABLE_FRESHNESS_SQL = "SELECT MAX(committed_at) AS last_modified FROM TABLE(table_snapshot('{table}'))"
+RESULT_CACHE_TRACKED_TTL_SECONDS = 24 * 60 * 60
+TABLE_FRESHNESS_MAX_BACKOFF_SECONDS = 60 * 60  # tables that cannot report a version are probed ever less often
+
+# Result snapshots stored with each assistant message
+SNAPSHOT_MAX_ROWS = 10_000
+SNAPSHOT_COMPRESSION = "zstd"  # any pyarrow Parquet codec, or None
+SNAPSHOT_SPILL_BYTES = 8 * 1024 * 1024  # larger snapshots go straight to disk
+SESSION_SNAPSHOT_MAX_BYTES = 32 * 1024 * 1024  # in-memory snapshot budget per session
+SNAPSHOT_SPILL_DIR = os.path.join(tempfile.gettempdir(), "cortex_analyst_snapshots")
+
+# Chat history kept in session state
+SESSION_HISTORY_MAX_BYTES = 1024 * 1024  # text, SQL and suggestions; oldest messages are trimmed first
+
+# Result fetch limits
+RESULT_PAGE_ROWS = 5_000  # rows fetched first and added per "load more"
+RESULT_MAX_ROWS = 100_000  # hard ceiling, also applied to the generated SQL
+RESULT_MAX_BYTES = 200 * 1024 * 1024  # stop fetching batches past this size
+
+# Warehouse-backed grid for browsing results larger than the fetched page
+GRID_PAGE_ROWS = 500
+GRID_CACHE_MAX_BYTES = 128 * 1024 * 1024
+GRID_FILTER_OPERATORS = ("contains", "=", "!=", ">", ">=", "<", "<=")
+
+# Full-result exports, written batch by batch to a temporary file
+EXPORT_MAX_ROWS = 5_000_000
+EXPORT_FORMATS = {  # button label -> (file extension, MIME type)
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Arrow IPC": ("arrow", "application/vnd.apache.arrow.file"),
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+}
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "cortex_analyst_exports")
+
+# Chart data reduction (keeps Vega specs small and under Altair's 5000-row limit)
+CHART_MAX_POINTS = 2_000
+HISTOGRAM_BINS = 40
+PIE_TOP_K = 10
+BAR_TOP_K = 50
+CHART_CACHE_MAX_BYTES = 64 * 1024 * 1024
+CHART_TYPES = (
+    "Line Chart 📈", "Bar Chart 📊", "Pie Chart 🥧", "Scatter Plot 🔵",
+    "Histogram 📊", "Box Plot 📦", "Combo Chart 🔀", "Number Chart 🔢"
+)
+CHART_MAX_CATEGORIES = 200  # text axes with more distinct values are refused for point-per-value charts
+PROFILE_CACHE_MAX_ENTRIES = 512
+PROFILE_TEMPORAL_SAMPLE = 100  # values inspected to detect dates stored as objects
+
+# Chat history rendering
+RECENT_TURNS_EXPANDED = 2  # older answers render collapsed until expanded
+
+# Performance instrumentation
+METRICS_MAX_SAMPLES = 2_000  # per-stage samples kept for percentiles
+METRICS_MAX_SPANS = 10_000  # recent spans kept for export
+
+# Conversation context sent with each question
+CONTEXT_MAX_TURNS = 5  # prior question/answer pairs
+CONTEXT_MAX_CHARS = 12_000
+CONTEXT_COMPACT_CHARS = 300  # per text/SQL field in compacted older answers
+
+# Data source detection. Keys with a dot match a qualified-name prefix
+# (database.schema); other keys match whole underscore-separated words.
+DATA_SOURCE_CATALOG = {
+    "salesforce": "🔹 Salesforce",
+    "odoo": "🟦 Odoo",
+    "sap": "🟨 SAP",
+    "dremio": "🔷 Dremio",
+    "warehouse": "🏢 Data Warehouse",
+}
+# Table names that identify a source when no schema matched the catalog
+DATA_SOURCE_TABLE_HINTS = {
+    "account": "🔹 Salesforce",
+    "opportunity": "🔹 Salesforce",
+    "lead": "🔹 Salesforce",
+    "contact": "🔹 Salesforce",
+    "partner": "🟦 Odoo",
+    "product": "🟦 Odoo",
+    "stock": "🟦 Odoo",
+}
+DEFAULT_DATA_SOURCE = "🏢 Data Warehouse"
+SQL_ANALYSIS_CACHE_SIZE = 1024
+
+# Speculative prefetch of suggested follow-up questions (opt-in per session)
+PREFETCH_TOP_N = 2
+PREFETCH_CONCURRENCY = 2
+PREFETCH_DAILY_BUDGET = 500  # warehouse calls per day across the process
+PREFETCH_RUN_SQL = True  # also run the generated SQL, not just the Cortex Analyst call
+
+# Cortex Analyst response cache (shared by all sessions in this process)
+RESPONSE_CACHE_TTL_SECONDS = 6 * 60 * 60
+RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+SEMANTIC_MODEL_POLL_SECONDS = 60
+
+# Welcome message shared by all new sessions
+WELCOME_QUERY = "What questions can I ask? Help me get started."
+WELCOME_REFRESH_SECONDS = 30 * 60
+WELCOME_RETRY_SECONDS = 60
+WELCOME_WAIT_SECONDS = 60
+
+# Background query execution
+ASYNC_EXECUTION = True  # False runs questions inline on the script thread
+QUERY_WORKER_THREADS = 8
+JOB_POLL_SECONDS = 1
+
+# Snowpark session pools (separate pools for Cortex Analyst and Dremio calls)
+CORTEX_POOL_MIN_SIZE = 1
+CORTEX_POOL_MAX_SIZE = 4
+DREMIO_POOL_MIN_SIZE = 1
+DREMIO_POOL_MAX_SIZE = 8
+POOL_ACQUIRE_TIMEOUT_SECONDS = 30
+POOL_HEALTH_CHECK_SECONDS = 5 * 60
+
+# Admission control for warehouse procedure calls
+SCHEDULER_MAX_CONCURRENCY = 8  # calls running at once across the process
+SCHEDULER_RESERVED_SLOTS = 2  # kept free of background work for interactive questions
+SCHEDULER_MAX_WAIT_SECONDS = 120
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("CORTEX_APP_RATE_LIMIT_PER_MINUTE", "30"))  # per user; 0 disables
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_BACKGROUND_PER_MINUTE = 10  # per user, for prefetches; separate from the interactive allowance
+RATE_LIMIT_BACKGROUND_BURST = 4
+PRIORITY_INTERACTIVE = 0
+PRIORITY_HISTORY = 1
+PRIORITY_BACKGROUND = 2
+
 # Page configuration
 st.set_page_config(
     page_title="Cortex Analyst Chat",
@@ -74,8 +253,6 @@ def initialize_session_state():
     """Initialize session state variables for chat functionality."""
     if "messages" not in st.session_state:
         st.session_state.messages = []
-    if "user_messages" not in st.session_state:
-        st.session_state.user_messages = []
     if "active_suggestion" not in st.session_state:
         st.session_state.active_suggestion = None
     if "message_counter" not in st.session_state:
@@ -92,6 +269,28 @@ def initialize_session_state():
         st.session_state.loading_start_time = None
     if "current_loading_message" not in st.session_state:
         st.session_state.current_loading_message = 0
+    if "row_limits" not in st.session_state:
+        st.session_state.row_limits = {}
+    if "grid_pages" not in st.session_state:
+        st.session_state.grid_pages = {}
+    if "prefetch_enabled" not in st.session_state:
+        st.session_state.prefetch_enabled = False
+    if "active_job" not in st.session_state:
+        st.session_state.active_job = None
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+        get_scheduler().identify(st.session_state.session_id, current_user_name())
+
+def current_user_name() -> Optional[str]:
+    """The signed-in user (e.g. the Snowflake user in Streamlit in Snowflake), or None when anonymous."""
+    try:
+        user = st.user.to_dict()
+    except Exception:
+        return None
+    for field in ("user_name", "email"):
+        if user.get(field):
+            return str(user[field])
+    return None
 
 def get_loading_message(elapsed_time: float) -> str:
     """Get dynamic loading message based on elapsed time."""
@@ -121,173 +320,2539 @@ def get_loading_message(elapsed_time: float) -> str:
         idx = int(elapsed_time / 3) % len(messages[6:])
         return messages[6 + idx]
 
-def display_dynamic_spinner(placeholder):
-    """Display dynamic spinner with changing messages."""
-    start_time = time.time()
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def display_dynamic_spinner(job: "QueryJob"):
+    """Poll a running query job, showing changing loading messages and a cancel button."""
+    if job.done:
+        # Let the full script pick up the finished job
+        st.rerun()
     
-    while st.session_state.processing:
-        elapsed = time.time() - start_time
-        message = get_loading_message(elapsed)
+    message = get_loading_message(job.elapsed)
+    stage_labels = {
+        "queued": "Waiting for a worker",
+        "analyzing": "Generating SQL with Cortex Analyst",
+        "executing": "Running the query in Dremio",
+    }
+    status = stage_labels.get(job.stage, "Working")
+    ticket = job.ticket
+    if ticket is not None and ticket.state == "rate_limited":
+        status = f"🚦 Rate limited, starting in {max(ticket.ready_at - time.monotonic(), 0):.0f}s"
+    elif ticket is not None and ticket.state == "queued":
+        status = f"⏳ Waiting for the warehouse (position {get_scheduler().position(ticket)} in queue)"
+    st.markdown(f"""
+    <div class="loading-messages">
+        <h4>{message}</h4>
+        <p>{status} • {job.elapsed:.0f}s elapsed</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    if st.button("⏹️ Cancel", key="cancel_active_job"):
+        job.cancel()
+        st.rerun()
+
+class MetricsRegistry:
+    """Process-wide timing spans aggregated into per-stage latency histograms.
+
+    Each stage keeps its last ``max_samples`` durations for percentile estimates
+    plus running totals; the most recent spans are retained for JSON-lines export.
+    """
+
+    def __init__(self, max_samples: int, max_spans: int):
+        self.max_samples = max_samples
+        self._samples: Dict[str, deque] = {}
+        self._totals: Dict[str, List[float]] = {}  # stage -> [count, seconds, rows, bytes]
+        self._spans: deque = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, started_at: float, duration: float, **attributes: Any) -> None:
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.max_samples)).append(duration)
+            totals = self._totals.setdefault(stage, [0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] += int(attributes.get("rows") or 0)
+            totals[3] += int(attributes.get("bytes") or 0)
+            self._spans.append({
+                "stage": stage,
+                "start": round(started_at, 6),
+                "duration_ms": round(duration * 1000, 3),
+                **attributes,
+            })
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-stage count, p50/p95/p99 latency (ms), and total rows and bytes."""
+        with self._lock:
+            snapshot = {stage: (np.array(samples), list(self._totals[stage])) for stage, samples in self._samples.items()}
+        rows = []
+        for stage, (samples, (count, seconds, total_rows, total_bytes)) in sorted(snapshot.items()):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+            rows.append({
+                "stage": stage, "count": count,
+                "p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1), "p99_ms": round(float(p99), 1),
+                "rows": total_rows, "bytes": total_bytes,
+            })
+        return rows
+
+    def export_jsonl(self) -> str:
+        """Recent spans as JSON lines."""
+        with self._lock:
+            spans = list(self._spans)
+        return "".join(json.dumps(span, default=str) + "\n" for span in spans)
+
+    def export_prometheus(self, gauges: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+        """Stage latencies as a Prometheus summary, plus optional labelled gauges.
+
+        ``gauges`` maps a metric name to ``{label_value: value}``; the label is
+        emitted as ``name="..."``.
+        """
+        lines = [
+            "# HELP cortex_app_stage_duration_seconds Latency of each request stage.",
+            "# TYPE cortex_app_stage_duration_seconds summary",
+        ]
+        with self._lock:
+            snapshot = {stage: (np.array(samples), list(self._totals[stage])) for stage, samples in self._samples.items()}
+        for stage, (samples, (count, seconds, _, _)) in sorted(snapshot.items()):
+            for quantile in (0.5, 0.95, 0.99):
+                value = np.percentile(samples, quantile * 100)
+                lines.append(f'cortex_app_stage_duration_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'cortex_app_stage_duration_seconds_sum{{stage="{stage}"}} {seconds:.6f}')
+            lines.append(f'cortex_app_stage_duration_seconds_count{{stage="{stage}"}} {count}')
         
-        with placeholder:
-            st.markdown(f"""
-            <div class="loading-messages">
-                <h4>{message}</h4>
-                <p>Please hold on while we process your request...</p>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Show spinner
-            with st.spinner(message):
-                time.sleep(1)  # Update every second
+        for metric, values in (gauges or {}).items():
+            lines.append(f"# TYPE cortex_app_{metric} gauge")
+            for label, value in values.items():
+                lines.append(f'cortex_app_{metric}{{name="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+@st.cache_resource
+def get_metrics() -> MetricsRegistry:
+    """Process-wide metrics registry."""
+    return MetricsRegistry(max_samples=METRICS_MAX_SAMPLES, max_spans=METRICS_MAX_SPANS)
+
+current_timed_stage: contextvars.ContextVar = contextvars.ContextVar("current_timed_stage", default=None)
+
+@contextmanager
+def timed_span(stage: str, **attributes: Any):
+    """Time a block as stage; the yielded dict can be filled with rows/bytes before it exits.
+
+    Inside a ``timed_stage`` block nested spans are not recorded, so that block's
+    work is timed once under its own stage.
+    """
+    if current_timed_stage.get() is not None:
+        yield attributes
+        return
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        get_metrics().record(stage, started_at, time.perf_counter() - start, **attributes)
+
+@contextmanager
+def timed_stage(stage: str, **attributes: Any):
+    """Time a block as a single stage, keeping the spans it contains out of their histograms."""
+    with timed_span(stage, **attributes) as span:
+        token = current_timed_stage.set(stage)
+        try:
+            yield span
+        finally:
+            current_timed_stage.reset(token)
+
+class StartupReport:
+    """Durations of the one-off phases that stand between a new process and a ready app.
+
+    Each phase is recorded once (later records are ignored) together with the
+    offset from process start at which it finished.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases.setdefault(phase, (seconds, time.perf_counter() - self.started))
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """One row per phase in order of completion."""
+        with self._lock:
+            phases = sorted(self.phases.items(), key=lambda item: item[1][1])
+        return [
+            {"phase": phase, "duration_ms": round(seconds * 1000, 1), "done_at_ms": round(done_at * 1000, 1)}
+            for phase, (seconds, done_at) in phases
+        ]
+
+@st.cache_resource
+def get_startup_report() -> StartupReport:
+    """Process-wide startup report, created by the first script run."""
+    return StartupReport()
+
+@dataclass
+class CacheEntry:
+    """A single cached value with its accounting metadata."""
+    value: Any
+    size: int
+    expires_at: Optional[float]
+    owner: Optional[str] = None
+    tags: Tuple[str, ...] = ()
+
+class LRUCache:
+    """Thread-safe LRU cache with TTL expiry, byte budgets and hit/miss counters.
+
+    ``max_bytes`` bounds the whole cache, ``owner_max_bytes`` bounds the entries
+    inserted by any single owner (e.g. one browser session). Least recently used
+    entries are evicted first when either budget is exceeded. Entries can carry
+    tags so that everything depending on e.g. a table can be invalidated at once.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: Optional[float] = None,
+        owner_max_bytes: Optional[int] = None,
+        size_of: Callable[[Any], int] = lambda value: 1,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.owner_max_bytes = owner_max_bytes
+        self.size_of = size_of
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._owner_bytes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry.expires_at is not None and entry.expires_at <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        owner: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        tags: Sequence[str] = (),
+    ) -> bool:
+        """Store value under key. Returns False if the value is too large to cache."""
+        size = int(self.size_of(value))
+        if size > self.max_bytes or (owner and self.owner_max_bytes and size > self.owner_max_bytes):
+            return False
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = time.time() + ttl if ttl else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(value, size, expires_at, owner, tuple(tags))
+            self._total_bytes += size
+            if owner:
+                self._owner_bytes[owner] = self._owner_bytes.get(owner, 0) + size
+                self._enforce_owner_budget(owner)
+            self._enforce_budget()
+        return True
+
+    def pop(self, key: Hashable) -> Any:
+        """Remove key from the cache and return its value (or None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._remove(key)
+            return entry.value
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Drop every entry tagged with tag; returns how many were dropped."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if tag in entry.tags]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def tags(self) -> set:
+        """Every tag carried by a current entry."""
+        with self._lock:
+            return {tag for entry in self._entries.values() for tag in entry.tags}
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._owner_bytes.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return a snapshot of cache counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry.expires_at is None or entry.expires_at > time.time())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry.size
+        if entry.owner:
+            remaining = self._owner_bytes.get(entry.owner, 0) - entry.size
+            if remaining > 0:
+                self._owner_bytes[entry.owner] = remaining
+            else:
+                self._owner_bytes.pop(entry.owner, None)
+
+    def _enforce_owner_budget(self, owner: str) -> None:
+        if not self.owner_max_bytes:
+            return
+        for key in [k for k, e in self._entries.items() if e.owner == owner]:
+            if self._owner_bytes.get(owner, 0) <= self.owner_max_bytes:
+                break
+            self._remove(key)
+            self.evictions += 1
+
+    def _enforce_budget(self) -> None:
+        while self._total_bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+current_flight_waiters: contextvars.ContextVar = contextvars.ContextVar("current_flight_waiters", default=None)
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for and receive the same result (or exception). Callers may
+    register a waiter (their warehouse request); while the function runs,
+    ``current_flight_waiters`` holds the live list of everyone waiting on it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executions = 0
+        self.coalesced = 0
+        self._calls: Dict[Hashable, Tuple[Future, List[Any]]] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any, waiter: Any = None) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = (Future(), [])
+                self.executions += 1
+            else:
+                self.coalesced += 1
+            future, waiters = call
+            if waiter is not None:
+                waiters.append(waiter)
+        
+        if not leader:
+            return future.result()
         
-        if not st.session_state.processing:
+        token = current_flight_waiters.set(waiters)
+        try:
+            result = fn(*args)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            current_flight_waiters.reset(token)
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"executions": self.executions, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+@st.cache_resource
+def get_single_flights() -> Dict[str, SingleFlight]:
+    """Process-wide request coalescing for Cortex Analyst and Dremio calls."""
+    return {"cortex": SingleFlight("cortex"), "dremio": SingleFlight("dremio")}
+
+def dataframe_size_bytes(df: pd.DataFrame) -> int:
+    """Approximate in-memory size of a DataFrame."""
+    return int(df.memory_usage(deep=True).sum())
+
+@st.cache_resource
+def get_result_cache() -> LRUCache:
+    """Process-wide cache of query results, shared across browser sessions."""
+    return LRUCache(
+        max_bytes=RESULT_CACHE_MAX_BYTES,
+        ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+        owner_max_bytes=RESULT_CACHE_SESSION_MAX_BYTES,
+        size_of=dataframe_size_bytes,
+    )
+
+def normalize_sql(sql_statement: str) -> str:
+    """Drop comments and collapse whitespace and trailing semicolons, leaving quoted literals intact.
+
+    Comments have to go because the result is joined onto one line, where a
+    ``--`` comment would swallow everything after it.
+    """
+    token_pattern = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(?:--[^\n]*|/\*.*?\*/|\s)+", re.DOTALL)
+    normalized = token_pattern.sub(
+        lambda m: m.group(0) if m.group(0)[0] in "'\"" else " ", sql_statement
+    )
+    return normalized.strip().rstrip(";").strip()
+
+# A LIMIT at the very end of a normalized statement belongs to the outermost query
+TRAILING_LIMIT_PATTERN = re.compile(r"\blimit\s+(\d+)(?:\s+offset\s+\d+)?$", re.IGNORECASE)
+TRAILING_PAGING_PATTERN = re.compile(r"\b(?:offset|fetch)\b[^()']*$", re.IGNORECASE)
+
+def result_cache_key(sql_statement: str, max_rows: int = RESULT_PAGE_ROWS) -> Tuple[str, str, int]:
+    """Cache key for a query result: semantic model path, normalized SQL and row limit."""
+    return SEMANTIC_MODEL_PATH, normalize_sql(sql_statement), max_rows
+
+def apply_row_limit(sql_statement: str, limit: int) -> str:
+    """Cap a generated statement at limit rows, keeping its own ORDER BY in effect.
+
+    The cap is appended to (or tightens) the statement's own trailing LIMIT; only
+    statements ending in OFFSET/FETCH are wrapped in a subquery instead.
+    """
+    normalized = normalize_sql(sql_statement)
+    limit = int(limit)
+    trailing_limit = TRAILING_LIMIT_PATTERN.search(normalized)
+    if trailing_limit:
+        if int(trailing_limit.group(1)) <= limit:
+            return normalized
+        return normalized[:trailing_limit.start(1)] + str(limit) + normalized[trailing_limit.end(1):]
+    if TRAILING_PAGING_PATTERN.search(normalized):
+        return f"SELECT * FROM ({normalized}) AS limited_result LIMIT {limit}"
+    return f"{normalized} LIMIT {limit}"
+
+def collect_batches(batches, max_rows: int) -> pd.DataFrame:
+    """Concatenate pandas batches, stopping once max_rows or RESULT_MAX_BYTES is exceeded.
+
+    The returned frame is cut to max_rows and flags any cut-off in
+    ``df.attrs["truncated"]`` ("rows" or "bytes").
+    """
+    frames = []
+    rows = 0
+    nbytes = 0
+    truncated = None
+    for batch in batches:
+        frames.append(batch)
+        rows += len(batch)
+        nbytes += dataframe_size_bytes(batch)
+        if rows > max_rows:
+            truncated = "rows"
             break
+        if nbytes > RESULT_MAX_BYTES:
+            truncated = "bytes"
+            break
+    
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if len(df) > max_rows:
+        df = df.head(max_rows)
+    df.attrs["truncated"] = truncated
+    return df
+
+def get_row_limit(message_id: str) -> int:
+    """Rows currently requested for a message's result in this session (grows with "load more")."""
+    return st.session_state.row_limits.get(message_id, RESULT_PAGE_ROWS)
+
+class SnowflakeBackend:
+    """Runs the app's procedures in Snowflake using the st.connection("snowflake") settings."""
+
+    name = "snowflake"
+
+    def primary_session(self):
+        """The shared connection session, used for light metadata queries."""
+        return st.connection("snowflake").session()
+
+    def create_session(self):
+        """Open a new Snowpark session for a connection pool.
+
+        Credentials are found the way st.connection("snowflake") finds them: the
+        [connections.snowflake] secrets, else the connector's default connection
+        (connections.toml or config file). Streamlit in Snowflake cannot open
+        extra sessions, so there the pool shares the app's active session.
+        """
+        from snowflake.snowpark import Session
+        from streamlit.connections.util import running_in_sis
+        
+        if running_in_sis():
+            return SharedSession(self.primary_session())
+        try:
+            configs = dict(st.secrets["connections"]["snowflake"])
+        except (KeyError, FileNotFoundError):
+            import snowflake.connector
+            configs = {"connection": snowflake.connector.connect()}
+        return Session.builder.configs(configs).create()
+
+class SharedSession:
+    """A session owned by someone else, lent to a pool that must not close it."""
+
+    def __init__(self, session: Any):
+        self.session = session
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.session, name)
+
+    def close(self) -> None:
+        pass
+
+class LocalBackend:
+    """Offline stand-in for Snowflake used for development and benchmarks.
+
+    Cortex Analyst calls replay recorded responses from a JSON fixtures file
+    (``{"responses": {question: content}}``) and fall back to a synthetic answer
+    with SQL; Dremio calls serve a synthetic pandas result honouring the
+    statement's LIMIT. Both sleep for a configurable latency first.
+    """
+
+    name = "local"
+
+    def __init__(self, fixtures_path: Optional[str], cortex_latency: float, dremio_latency: float, rows: int):
+        self.cortex_latency = cortex_latency
+        self.dremio_latency = dremio_latency
+        self.rows = rows
+        self.responses: Dict[str, Dict] = {}
+        if fixtures_path:
+            with open(fixtures_path) as f:
+                recorded = json.load(f).get("responses", {})
+            self.responses = {normalize_question(q): content for q, content in recorded.items()}
+        self._result: Optional[pd.DataFrame] = None
+
+    def primary_session(self):
+        return LocalSession(self)
+
+    def create_session(self):
+        return LocalSession(self)
+
+    def answer(self, messages_json: str, cancelled: threading.Event) -> str:
+        self.wait(self.cortex_latency, cancelled)
+        question = json.loads(messages_json)[-1]["content"][0]["text"]
+        content = self.responses.get(normalize_question(question)) or {
+            "message": {"content": [
+                {"type": "text", "text": f"This is a local answer to: {question}"},
+                {"type": "sql", "statement": "SELECT category, created_at, amount, quantity\nFROM local.synthetic.sales\n -- Generated by Cortex Analyst\n;"},
+                {"type": "suggestions", "suggestions": ["Show amount by category", "Show quantity over time"]},
+            ]}
+        }
+        return json.dumps({"success": True, "content": content})
+
+    def query(self, sql_statement: str, cancelled: threading.Event) -> "LocalResult":
+        self.wait(self.dremio_latency, cancelled)
+        if "table_snapshot(" in sql_statement:
+            # Table freshness probes: the synthetic tables never change
+            return LocalResult(pd.DataFrame({"LAST_MODIFIED": [pd.Timestamp("2024-01-01")]}))
+        depth = 0
+        for kind, value in tokenize_sql(sql_statement):
+            depth += {"(": 1, ")": -1}.get(value, 0) if kind == "punct" else 0
+            if depth < 0:
+                break
+        if depth:
+            # What the warehouse would say about e.g. a wrapper swallowed by a -- comment
+            raise ValueError(f"SQL compilation error: unbalanced parentheses in {sql_statement!r}")
+        limit = re.search(r"\bLIMIT\s+(\d+)\s*$", sql_statement, re.IGNORECASE)
+        df = self.synthetic_result()
+        return LocalResult(df.head(int(limit.group(1))) if limit else df)
+
+    def wait(self, seconds: float, cancelled: threading.Event) -> None:
+        """Simulate warehouse latency, failing like Snowflake if the statement is cancelled."""
+        if cancelled.wait(seconds):
+            raise ValueError("SQL execution canceled")
+
+    def synthetic_result(self) -> pd.DataFrame:
+        """A deterministic sales-like frame with LOCAL_RESULT_ROWS rows."""
+        if self._result is None:
+            rng = np.random.default_rng(0)
+            self._result = pd.DataFrame({
+                "CATEGORY": rng.choice([f"Category {i}" for i in range(20)], self.rows),
+                "CREATED_AT": pd.date_range("2024-01-01", periods=self.rows, freq="min"),
+                "AMOUNT": rng.gamma(2.0, 150.0, self.rows).round(2),
+                "QUANTITY": rng.integers(1, 50, self.rows),
+            })
+        return self._result
+
+class LocalSession:
+    """Duck-typed Snowpark session that routes procedure calls to a LocalBackend."""
+
+    def __init__(self, backend: LocalBackend):
+        self.backend = backend
+        self._cancelled = threading.Event()
+
+    def call(self, procedure: str, *args: Any):
+        # Like Snowflake's cancel_all, a cancel only reaches statements already running
+        self._cancelled = cancelled = threading.Event()
+        if procedure == CHAT_PROCEDURE:
+            return self.backend.answer(args[0], cancelled)
+        if procedure == DREMIO_PROCEDURE:
+            return self.backend.query(args[0], cancelled)
+        raise ValueError(f"Unknown procedure: {procedure}")
+
+    def sql(self, query: str) -> "LocalResult":
+        if query.startswith("LIST @"):
+            # The local semantic model never changes version
+            return LocalResult(pd.DataFrame({"md5": ["local"], "last_modified": ["2024-01-01"]}))
+        # Other metadata queries (health checks) return nothing interesting
+        return LocalResult(pd.DataFrame())
+
+    def cancel_all(self) -> None:
+        self._cancelled.set()
+
+    def close(self) -> None:
+        pass
+
+class LocalResult:
+    """Minimal stand-in for a Snowpark DataFrame."""
 
-def call_cortex_analyst_procedure(user_message: str) -> Tuple[Optional[Dict], Optional[str]]:
-    """Call the Cortex Analyst procedure with user message."""
+    def __init__(self, df: pd.DataFrame, batch_rows: int = 10_000):
+        self.df = df
+        self.batch_rows = batch_rows
+
+    def to_pandas_batches(self):
+        for start in range(0, len(self.df), self.batch_rows):
+            yield self.df.iloc[start:start + self.batch_rows]
+
+    def to_pandas(self) -> pd.DataFrame:
+        return self.df
+
+    def collect(self) -> List[Any]:
+        return [LocalRow(record) for record in self.df.to_dict("records")]
+
+class LocalRow:
+    """Minimal stand-in for a Snowpark Row."""
+
+    def __init__(self, values: Dict[str, Any]):
+        self.values = values
+
+    def as_dict(self) -> Dict[str, Any]:
+        return self.values
+
+@st.cache_resource
+def get_backend():
+    """The configured warehouse backend (see WAREHOUSE_BACKEND)."""
+    if WAREHOUSE_BACKEND == "local":
+        return LocalBackend(
+            LOCAL_FIXTURES_PATH,
+            cortex_latency=LOCAL_CORTEX_LATENCY_SECONDS,
+            dremio_latency=LOCAL_DREMIO_LATENCY_SECONDS,
+            rows=LOCAL_RESULT_ROWS,
+        )
+    return SnowflakeBackend()
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled session becomes available within the acquire timeout."""
+
+class SessionPool:
+    """Bounded pool of Snowpark sessions with health checks and wait-time metrics.
+
+    Sessions are created on demand up to ``max_size``; ``min_size`` sessions are
+    opened up front by a background warm-up thread. Idle sessions that have not been used for
+    ``health_check_seconds`` are validated with ``SELECT 1`` before reuse.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        min_size: int,
+        max_size: int,
+        acquire_timeout: float,
+        health_check_seconds: float,
+    ):
+        self.name = name
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_seconds = health_check_seconds
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._warming = min_size
+        self._size = min_size
+        
+        # Open the minimum sessions off the render thread so a cold start is not blocked on them
+        threading.Thread(target=self._warm_up, name=f"{name}-pool-warm-up", daemon=True).start()
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        """Check out a healthy session, waiting up to timeout seconds for one to free up."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.time()
+        deadline = started + timeout
+        
+        while True:
+            candidate = None
+            create = False
+            with self._condition:
+                # Sessions still being opened by the warm-up are waited for rather than duplicated
+                while not self._idle and (self._size >= self.max_size or self._warming):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(f"No {self.name} session available after {timeout:.0f}s")
+                    self._condition.wait(remaining)
+                if self._idle:
+                    candidate, last_used = self._idle.pop()
+                else:
+                    create = True
+                    last_used = time.time()
+                    self._size += 1
+                self._in_use += 1
+            
+            try:
+                if create:
+                    candidate = self.factory()
+                elif time.time() - last_used > self.health_check_seconds and not self._is_healthy(candidate):
+                    self._discard(candidate)
+                    continue
+            except Exception:
+                self._discard(candidate)
+                raise
+            
+            waited = time.time() - started
+            with self._condition:
+                self.acquisitions += 1
+                self.total_wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            return candidate
+
+    def release(self, pooled_session: Any, suspect: bool = False) -> None:
+        """Return a session to the pool; suspect sessions are health-checked on next use."""
+        with self._condition:
+            self._in_use -= 1
+            self._idle.append((pooled_session, 0.0 if suspect else time.time()))
+            self._condition.notify()
+
+    @contextmanager
+    def session(self):
+        """Context manager that checks a session out and always returns it."""
+        pooled_session = self.acquire()
+        suspect = False
+        try:
+            yield pooled_session
+        except snowpark_exceptions.SnowparkSQLException:
+            raise
+        except Exception:
+            suspect = True
+            raise
+        finally:
+            self.release(pooled_session, suspect=suspect)
+
+    def stats(self) -> Dict[str, float]:
+        """Return pool size, utilization and wait-time metrics."""
+        with self._condition:
+            return {
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+                "utilization": self._in_use / self.max_size if self.max_size else 0.0,
+                "acquisitions": self.acquisitions,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": 1000 * self.total_wait_seconds / self.acquisitions if self.acquisitions else 0.0,
+                "max_wait_ms": 1000 * self.max_wait_seconds,
+            }
+
+    def _warm_up(self) -> None:
+        started = time.perf_counter()
+        for _ in range(self.min_size):
+            try:
+                pooled_session = self.factory()
+            except Exception:
+                # Failed warm-up sessions are simply opened on demand later
+                with self._condition:
+                    self._size -= 1
+                    self._warming -= 1
+                    self._condition.notify_all()
+                continue
+            with self._condition:
+                self._idle.append((pooled_session, time.time()))
+                self._warming -= 1
+                self._condition.notify_all()
+        get_startup_report().record(f"{self.name} pool warm-up", time.perf_counter() - started)
+
+    def _is_healthy(self, pooled_session: Any) -> bool:
+        try:
+            pooled_session.sql("SELECT 1").collect()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, pooled_session: Any) -> None:
+        with self._condition:
+            self._size -= 1
+            self._in_use -= 1
+            self._condition.notify()
+        if pooled_session is not None:
+            try:
+                pooled_session.close()
+            except Exception:
+                pass
+
+@st.cache_resource
+def get_cortex_pool() -> SessionPool:
+    """Process-wide session pool for Cortex Analyst procedure calls."""
+    return SessionPool(
+        "Cortex Analyst", get_backend().create_session,
+        min_size=CORTEX_POOL_MIN_SIZE, max_size=CORTEX_POOL_MAX_SIZE,
+        acquire_timeout=POOL_ACQUIRE_TIMEOUT_SECONDS, health_check_seconds=POOL_HEALTH_CHECK_SECONDS,
+    )
+
+@st.cache_resource
+def get_dremio_pool() -> SessionPool:
+    """Process-wide session pool for Dremio procedure calls."""
+    return SessionPool(
+        "Dremio", get_backend().create_session,
+        min_size=DREMIO_POOL_MIN_SIZE, max_size=DREMIO_POOL_MAX_SIZE,
+        acquire_timeout=POOL_ACQUIRE_TIMEOUT_SECONDS, health_check_seconds=POOL_HEALTH_CHECK_SECONDS,
+    )
+
+class AdmissionError(Exception):
+    """Raised when a warehouse call is rate limited or cannot get a slot in time."""
+
+class TokenBucket:
+    """Token bucket holding up to ``burst`` calls, refilled at ``rate_per_second``."""
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self, allow_debt: bool) -> Optional[float]:
+        """Take a token and return the seconds until it is usable (0 if now).
+
+        Without allow_debt an empty bucket returns None and nothing is taken.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1 and not allow_debt:
+            return None
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self) -> None:
+        self.tokens += 1
+
+class SchedulerTicket:
+    """One warehouse call waiting for, or holding, a scheduler slot.
+
+    A coalesced call is made on behalf of several requests: it queues at the best
+    priority among them and is only abandoned once all of them are cancelled.
+    While it runs, the pooled session it runs on is recorded so that
+    ``cancel_statement`` can stop the statement in the warehouse.
+    """
+
+    def __init__(self, requests: List[WarehouseRequest], seq: int):
+        self.requests = requests  # may grow while the ticket waits
+        self.seq = seq
+        self.state = "rate_limited"  # then "admitted"; slot tickets go "queued", then "running"
+        self.ready_at = 0.0  # time.monotonic() at which a rate-limited ticket may queue
+        self.session: Optional[Any] = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def owner(self) -> Optional[str]:
+        return self.requests[0].owner
+
+    @property
+    def priority(self) -> int:
+        return min(request.priority for request in self.requests)
+
+    @property
+    def cancelled(self) -> bool:
+        return all(request.job is not None and request.job.cancelled for request in self.requests)
+
+    @contextmanager
+    def running_on(self, pooled_session: Any):
+        """Record pooled_session as running this ticket's statement for the duration of the block."""
+        with self._session_lock:
+            self.session = pooled_session
+        try:
+            if self.cancelled:
+                raise AdmissionError("Request cancelled")
+            yield
+        finally:
+            # Cleared before the session goes back to the pool, so a late cancel cannot hit its next user
+            with self._session_lock:
+                self.session = None
+
+    def cancel_statement(self) -> bool:
+        """Cancel the running statement once every request is cancelled; False if it was left running.
+
+        Shared sessions (Streamlit in Snowflake) are never cancelled, since
+        cancel_all would also stop every other statement the app is running.
+        """
+        with self._session_lock:
+            if self.session is None or not self.cancelled or isinstance(self.session, SharedSession):
+                return False
+            self.session.cancel_all()
+            return True
+
+class WarehouseScheduler:
+    """Admission control in front of the Cortex Analyst and Dremio procedure calls.
+
+    At most ``max_concurrency`` calls run at once; background calls may only use
+    the slots beyond ``reserved_slots``. Waiting calls are admitted by priority
+    (interactive, then history reloads, then background prefetches) and then in
+    arrival order. Each user has a token bucket for interactive and history
+    calls, which wait for a token, and a smaller one for background calls, which
+    are rejected when it is empty, so prefetches never spend interactive tokens.
+    Owners (browser sessions) are charged to their user once ``identify`` has
+    named it, so a reload or new tab does not start with a fresh burst.
+    Coalesced calls charge every caller through ``admit`` before they join, so
+    one caller's cancellation or empty bucket never fails the others.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        reserved_slots: int,
+        rate_per_minute: float,
+        burst: int,
+        max_wait_seconds: float,
+        background_rate_per_minute: float = 0.0,
+        background_burst: int = 0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.reserved_slots = reserved_slots
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_wait_seconds = max_wait_seconds
+        self.background_rate_per_minute = background_rate_per_minute or rate_per_minute
+        self.background_burst = background_burst or burst
+        self.admitted = 0
+        self.rejected = 0
+        self._running = 0
+        self._seq = 0
+        self._waiting: List[SchedulerTicket] = []
+        self._users: Dict[str, str] = {}
+        self._buckets: Dict[Tuple[str, bool], TokenBucket] = {}
+        self._condition = threading.Condition()
+
+    def identify(self, owner: str, user: Optional[str]) -> None:
+        """Charge owner's calls to user's token buckets from now on."""
+        if user:
+            with self._condition:
+                self._users[owner] = user
+
+    def admit(self, request: Optional[WarehouseRequest] = None) -> None:
+        """Charge request's owner for one call, waiting for a token if needed."""
+        ticket = self._new_ticket([request or WarehouseRequest()])
+        self._wait_for_token(ticket)
+        ticket.state = "admitted"
+
+    @contextmanager
+    def slot(self, request: Optional[WarehouseRequest] = None):
+        """Hold a slot for one warehouse call made on behalf of request.
+
+        Inside a SingleFlight call the slot is shared by the requests waiting on
+        that call, which were charged by admit() before joining it.
+        """
+        request = request or WarehouseRequest()
+        waiters = current_flight_waiters.get()
+        with timed_span("queue_wait", priority=request.priority):
+            if waiters:
+                ticket = self._new_ticket(waiters)
+            else:
+                self.admit(request)
+                ticket = self._new_ticket([request])
+            self._wait_for_turn(ticket)
+        try:
+            yield ticket
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    def position(self, ticket: SchedulerTicket) -> int:
+        """1-based place of a queued ticket in admission order (0 once it runs)."""
+        with self._condition:
+            if ticket.state != "queued":
+                return 0
+            return 1 + sum(1 for other in self._waiting if (other.priority, other.seq) < (ticket.priority, ticket.seq))
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "running": self._running,
+                "queued": len(self._waiting),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+    def _new_ticket(self, requests: List[WarehouseRequest]) -> SchedulerTicket:
+        with self._condition:
+            self._seq += 1
+            ticket = SchedulerTicket(requests, self._seq)
+        self._report_ticket(ticket)
+        return ticket
+
+    def _report_ticket(self, ticket: SchedulerTicket) -> None:
+        for request in list(ticket.requests):
+            if request.job is not None:
+                request.job.ticket = ticket
+
+    def _wait_for_token(self, ticket: SchedulerTicket) -> None:
+        if ticket.owner is None or self.rate_per_minute <= 0:
+            return
+        background = ticket.priority >= PRIORITY_BACKGROUND
+        rate_per_minute = self.background_rate_per_minute if background else self.rate_per_minute
+        with self._condition:
+            key = (self._users.get(ticket.owner, ticket.owner), background)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                burst = self.background_burst if background else self.burst
+                bucket = self._buckets[key] = TokenBucket(rate_per_minute / 60, burst)
+            delay = bucket.reserve(allow_debt=not background)
+            if delay is None or delay > self.max_wait_seconds:
+                if delay is not None:
+                    bucket.refund()
+                self.rejected += 1
+                raise AdmissionError(f"Rate limit of {rate_per_minute:.0f} calls per minute reached")
+            ticket.ready_at = time.monotonic() + delay
+        
+        while time.monotonic() < ticket.ready_at:
+            if ticket.cancelled:
+                with self._condition:
+                    bucket.refund()
+                raise AdmissionError("Request cancelled")
+            time.sleep(min(ticket.ready_at - time.monotonic(), 0.5))
+
+    def _wait_for_turn(self, ticket: SchedulerTicket) -> None:
+        deadline = time.monotonic() + self.max_wait_seconds
+        with self._condition:
+            self._waiting.append(ticket)
+            ticket.state = "queued"
+            while True:
+                # Priorities rise as callers join a coalesced call, so the order is recomputed each time
+                first = min(self._waiting, key=lambda waiting: (waiting.priority, waiting.seq))
+                limit = self.max_concurrency - (self.reserved_slots if ticket.priority >= PRIORITY_BACKGROUND else 0)
+                if first is ticket and self._running < limit:
+                    break
+                self._report_ticket(ticket)
+                remaining = deadline - time.monotonic()
+                cancelled = ticket.cancelled
+                if remaining <= 0 or cancelled:
+                    self._waiting.remove(ticket)
+                    self.rejected += 1
+                    self._condition.notify_all()
+                    raise AdmissionError("Request cancelled" if cancelled else f"No warehouse slot after {self.max_wait_seconds:.0f}s")
+                # Wake periodically so cancelled jobs leave the queue promptly
+                self._condition.wait(min(remaining, 1.0))
+            self._waiting.remove(ticket)
+            self._running += 1
+            self.admitted += 1
+            ticket.state = "running"
+            # The next ticket in line may fit in a remaining slot
+            self._condition.notify_all()
+
+@dataclass(frozen=True)
+class WarehouseRequest:
+    """Who a warehouse call is made for and how urgent it is."""
+    owner: Optional[str] = None
+    priority: int = PRIORITY_INTERACTIVE
+    job: Optional[Any] = None  # QueryJob to report the ticket to
+
+current_warehouse_request: contextvars.ContextVar = contextvars.ContextVar("current_warehouse_request", default=None)
+
+@contextmanager
+def warehouse_request(owner: Optional[str], priority: int, job: Optional[Any] = None):
+    """Attribute warehouse calls made inside the block to owner at priority."""
+    token = current_warehouse_request.set(WarehouseRequest(owner, priority, job))
     try:
-        messages_list = [{
+        yield
+    finally:
+        current_warehouse_request.reset(token)
+
+@st.cache_resource
+def get_scheduler() -> WarehouseScheduler:
+    """Process-wide admission control for warehouse procedure calls."""
+    return WarehouseScheduler(
+        SCHEDULER_MAX_CONCURRENCY, SCHEDULER_RESERVED_SLOTS,
+        rate_per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST, max_wait_seconds=SCHEDULER_MAX_WAIT_SECONDS,
+        background_rate_per_minute=RATE_LIMIT_BACKGROUND_PER_MINUTE, background_burst=RATE_LIMIT_BACKGROUND_BURST,
+    )
+
+def call_cortex_analyst_procedure(user_message: str, context: Sequence[str] = ()) -> Tuple[Optional[Dict], Optional[str]]:
+    """Call the Cortex Analyst procedure with user message and serialized prior turns."""
+    try:
+        current_message = {
             "role": "user",
             "content": [{"type": "text", "text": user_message}]
-        }]
+        }
         
-        messages_json = json.dumps(messages_list)
-        result = session.call(CHAT_PROCEDURE, messages_json, SEMANTIC_MODEL_PATH)
+        # Prior turns arrive pre-serialized, so only the new message is dumped here
+        messages_json = "[" + ",".join([*context, json.dumps(current_message)]) + "]"
+        with get_scheduler().slot(current_warehouse_request.get()) as ticket:
+            with timed_span("cortex_call", bytes=len(messages_json)) as span:
+                with get_cortex_pool().session() as pooled_session, ticket.running_on(pooled_session):
+                    result = pooled_session.call(CHAT_PROCEDURE, messages_json, SEMANTIC_MODEL_PATH)
+                span["response_bytes"] = len(result) if result else 0
         
         if not result:
             return None, "No response from procedure"
         
-        procedure_response = json.loads(result)
+        with timed_span("json_parse", bytes=len(result)):
+            procedure_response = json.loads(result)
         
         if procedure_response.get("success", False):
             return procedure_response.get("content", {}), None
         else:
             return None, procedure_response.get("error_message", "Unknown procedure error")
             
-    except SnowparkSQLException as e:
+    except snowpark_exceptions.SnowparkSQLException as e:
         return None, f"Database Error: {str(e)}"
+    except (PoolTimeoutError, AdmissionError) as e:
+        return None, f"Service busy: {str(e)}"
     except json.JSONDecodeError as e:
         return None, f"Invalid JSON response: {str(e)}"
     except Exception as e:
         return None, f"Unexpected error: {str(e)}"
 
-def call_dremio_data_procedure(sql_statement: str) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
-    """Execute SQL via Dremio procedure."""
+class SemanticModelWatcher:
+    """Tracks the version of the semantic model YAML on its stage.
+
+    A background thread lists the stage once every ``poll_seconds`` on a pooled
+    session; when the file's checksum or modification time changes, every
+    registered callback is invoked. Readers only see the stored version.
+    """
+
+    def __init__(self, model_path: str, poll_seconds: float):
+        self.model_path = model_path
+        self.poll_seconds = poll_seconds
+        self.version: Optional[str] = None
+        self._callbacks: List[Callable[[Optional[str]], None]] = []
+        self._thread = threading.Thread(target=self._run, name="semantic-model-watcher", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def on_change(self, callback: Callable[[Optional[str]], None]) -> None:
+        """Register a callback invoked with the new version when the model changes."""
+        self._callbacks.append(callback)
+
+    def current_version(self) -> Optional[str]:
+        """Return the semantic model version seen by the last poll (None until the first one)."""
+        return self.version
+
+    def poll(self) -> None:
+        """Re-read the model's version once and notify callbacks if it changed."""
+        previous = self.version
+        self.version = self._fetch_version() or previous
+        if previous is not None and self.version != previous:
+            for callback in self._callbacks:
+                callback(self.version)
+
+    def _fetch_version(self) -> Optional[str]:
+        try:
+            with get_cortex_pool().session() as pooled_session:
+                rows = pooled_session.sql(f"LIST @{self.model_path}").collect()
+            if not rows:
+                return None
+            row = rows[0].as_dict()
+            return f"{row.get('md5', '')}:{row.get('last_modified', '')}"
+        except Exception:
+            return None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                pass
+            time.sleep(self.poll_seconds)
+
+@st.cache_resource
+def get_semantic_model_watcher() -> SemanticModelWatcher:
+    """Start the process-wide watcher for the semantic model file on first use."""
+    watcher = SemanticModelWatcher(SEMANTIC_MODEL_PATH, SEMANTIC_MODEL_POLL_SECONDS)
+    watcher.start()
+    return watcher
+
+@st.cache_resource
+def get_response_cache() -> LRUCache:
+    """Process-wide cache of Cortex Analyst responses, shared across browser sessions."""
+    cache = LRUCache(
+        max_bytes=RESPONSE_CACHE_MAX_BYTES,
+        ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+        size_of=lambda content: len(json.dumps(content, default=str)),
+    )
+    get_semantic_model_watcher().on_change(lambda version: cache.clear())
+    return cache
+
+def normalize_question(question: str) -> str:
+    """Case-fold and collapse whitespace so trivially different phrasings share a cache key."""
+    return " ".join(question.lower().split()).rstrip(" ?.!")
+
+def response_cache_key(question: str, context: Sequence[str] = ()) -> Tuple[str, Optional[str], str, Optional[str]]:
+    """Cache key for an analyst response: semantic model path and version, normalized question and context."""
+    version = get_semantic_model_watcher().current_version()
+    context_hash = hashlib.sha1("\n".join(context).encode()).hexdigest() if context else None
+    return SEMANTIC_MODEL_PATH, version, normalize_question(question), context_hash
+
+def get_analyst_response(question: str, context: Sequence[str] = ()) -> Tuple[Optional[Dict], Optional[str]]:
+    """Return the Cortex Analyst response for question, calling the procedure only on a cache miss."""
+    cache = get_response_cache()
+    key = response_cache_key(question, context)
+    
+    response_content = cache.get(key)
+    if response_content is not None:
+        return response_content, None
+    
+    def run_and_cache():
+        response_content, error = call_cortex_analyst_procedure(question, context)
+        if response_content and not error:
+            cache.set(key, response_content)
+        return response_content, error
+    
+    request = current_warehouse_request.get() or WarehouseRequest()
+    try:
+        get_scheduler().admit(request)
+    except AdmissionError as e:
+        return None, f"Service busy: {str(e)}"
+    # Identical questions already in flight share that call
+    return get_single_flights()["cortex"].do(key, run_and_cache, waiter=request)
+
+class WelcomeMessageService:
+    """Computes the welcome response once per process and keeps it fresh in the background.
+
+    New sessions read the precomputed response instead of each making their own
+    Cortex Analyst call. The response is refreshed every ``refresh_seconds`` and
+    immediately whenever the semantic model changes.
+    """
+
+    def __init__(self, question: str, refresh_seconds: float):
+        self.question = question
+        self.refresh_seconds = refresh_seconds
+        self.response: Optional[Dict] = None
+        self.refreshed_at: Optional[float] = None
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="welcome-refresh", daemon=True)
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Return the welcome response, waiting up to timeout for the first computation."""
+        self._ready.wait(timeout)
+        return self.response
+
+    def invalidate(self) -> None:
+        """Ask the background thread to recompute the response now."""
+        self._wake.set()
+
+    def refresh(self) -> None:
+        with warehouse_request(None, PRIORITY_BACKGROUND):
+            response_content, error = call_cortex_analyst_procedure(self.question)
+        if response_content and not error:
+            self.response = response_content
+            self.refreshed_at = time.time()
+            get_startup_report().record("welcome message", time.perf_counter() - self._started)
+            get_response_cache().set(response_cache_key(self.question), response_content)
+        self._ready.set()
+
+    def _run(self) -> None:
+        while True:
+            self.refresh()
+            self._wake.wait(self.refresh_seconds if self.response else WELCOME_RETRY_SECONDS)
+            self._wake.clear()
+
+@st.cache_resource
+def get_welcome_service() -> WelcomeMessageService:
+    """Start the process-wide welcome message service on first use."""
+    service = WelcomeMessageService(WELCOME_QUERY, WELCOME_REFRESH_SECONDS)
+    get_semantic_model_watcher().on_change(lambda version: service.invalidate())
+    service.start()
+    return service
+
+def is_query_result(df_result: Any) -> bool:
+    """Whether the Dremio procedure returned something iter_result_batches can read."""
+    return hasattr(df_result, "to_pandas_batches") or hasattr(df_result, "to_pandas") or isinstance(df_result, pd.DataFrame)
+
+def iter_result_batches(df_result: Any):
+    """Yield a Dremio procedure result as pandas batches, streaming when the result supports it."""
+    if hasattr(df_result, "to_pandas_batches"):
+        yield from df_result.to_pandas_batches()
+    elif hasattr(df_result, "to_pandas"):
+        yield df_result.to_pandas()
+    else:
+        yield df_result
+
+def call_dremio_data_procedure(sql_statement: str, max_rows: int = RESULT_PAGE_ROWS) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """Execute SQL via Dremio procedure, streaming at most max_rows rows back in batches."""
     try:
-        df_result = session.call(DREMIO_PROCEDURE, sql_statement)
+        max_rows = min(max_rows, RESULT_MAX_ROWS)
+        # One extra row tells us whether the result was cut off
+        limited_sql = apply_row_limit(sql_statement, max_rows + 1)
         
-        if hasattr(df_result, "to_pandas"):
-            return df_result.to_pandas(), None
-        elif isinstance(df_result, pd.DataFrame):
-            return df_result, None
-        else:
-            return None, "Unexpected result format from Dremio procedure"
+        with get_scheduler().slot(current_warehouse_request.get()) as ticket, get_dremio_pool().session() as pooled_session:
+            with ticket.running_on(pooled_session):
+                with timed_span("dremio_execute", bytes=len(limited_sql)):
+                    df_result = pooled_session.call(DREMIO_PROCEDURE, limited_sql)
+                
+                with timed_span("to_pandas") as span:
+                    if not is_query_result(df_result):
+                        return None, "Unexpected result format from Dremio procedure"
+                    df = collect_batches(iter_result_batches(df_result), max_rows)
+                    span["rows"] = len(df)
+                    span["bytes"] = dataframe_size_bytes(df)
+                return df, None
             
-    except SnowparkSQLException as e:
+    except snowpark_exceptions.SnowparkSQLException as e:
         return None, f"Dremio SQL Error: {str(e)}"
+    except (PoolTimeoutError, AdmissionError) as e:
+        return None, f"Dremio busy: {str(e)}"
     except Exception as e:
         return None, f"Dremio Error: {str(e)}"
 
-def identify_data_sources_from_sql(sql_statement: str) -> List[str]:
-    """Identify data sources from SQL statement."""
-    sources = []
-    sql_lower = sql_statement.lower()
-    
-    source_mapping = {
-        'salesforce': '🔹 Salesforce',
-        'odoo': '🟦 Odoo', 
-        'sap': '🟨 SAP',
-        'dremio': '🔷 Dremio',
-        'warehouse': '🏢 Data Warehouse'
-    }
+def fetch_query_result(
+    sql_statement: str, owner: Optional[str] = None, max_rows: int = RESULT_PAGE_ROWS
+) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """Return the result of sql_statement, running it via Dremio only on a cache miss."""
+    cache = get_result_cache()
+    key = result_cache_key(sql_statement, max_rows)
+    
+    df = cache.get(key)
+    if df is not None:
+        return df, None
+    
+    def run_and_cache():
+        versions = watch_query_tables(sql_statement)
+        df, error = call_dremio_data_procedure(sql_statement, max_rows)
+        if df is not None:
+            cache_query_result(cache, key, df, versions, owner)
+        return df, error
+    
+    request = current_warehouse_request.get() or WarehouseRequest()
+    try:
+        get_scheduler().admit(request)
+    except AdmissionError as e:
+        return None, f"Dremio busy: {str(e)}"
+    # Identical statements already running elsewhere share that execution
+    return get_single_flights()["dremio"].do(key, run_and_cache, waiter=request)
+
+class TableFreshnessMonitor:
+    """Tracks the last-modified version of the tables that cached results were read from.
+
+    A background thread re-reads every watched table's version once per
+    ``poll_seconds`` with ``version_sql``; when a version changes, callbacks
+    receive the table name. Tables that ``active_tables`` no longer reports are
+    forgotten. Tables whose version cannot be read stay unknown and are probed
+    with exponential backoff, up to ``max_backoff_seconds`` apart.
+    """
+
+    def __init__(
+        self, poll_seconds: float, version_sql: str, active_tables: Callable[[], set], max_backoff_seconds: float
+    ):
+        self.poll_seconds = poll_seconds
+        self.version_sql = version_sql
+        self.active_tables = active_tables
+        self.max_backoff_seconds = max_backoff_seconds
+        self.changes = 0
+        self._versions: Dict[str, Optional[str]] = {}
+        self._watched_at: Dict[str, float] = {}
+        self._failures: Dict[str, int] = {}
+        self._next_probe: Dict[str, float] = {}
+        self._callbacks: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="table-freshness", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def on_change(self, callback: Callable[[str], None]) -> None:
+        """Register a callback invoked with a table name when its version changes."""
+        self._callbacks.append(callback)
+
+    def watch(self, tables: Sequence[str]) -> Dict[str, Optional[str]]:
+        """Start tracking tables and return their current versions (None where unknown)."""
+        now = time.time()
+        with self._lock:
+            for table in tables:
+                self._versions.setdefault(table, None)
+                self._watched_at[table] = now
+            return {table: self._versions[table] for table in tables}
+
+    def unchanged(self, versions: Dict[str, Optional[str]]) -> bool:
+        """True when every table in versions had a known version that is still current."""
+        with self._lock:
+            return bool(versions) and all(
+                version is not None and self._versions.get(table) == version for table, version in versions.items()
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "tables": len(self._versions),
+                "known": sum(1 for version in self._versions.values() if version is not None),
+                "backing_off": sum(1 for failures in self._failures.values() if failures),
+                "changes": self.changes,
+            }
+
+    def poll(self) -> None:
+        """Re-read every watched table's version once."""
+        active = self.active_tables()
+        with self._lock:
+            # A table watched during the last interval may not be cached yet
+            stale_before = time.time() - self.poll_seconds
+            for table in [t for t in self._versions if t not in active and self._watched_at[t] < stale_before]:
+                del self._versions[table], self._watched_at[table]
+                self._failures.pop(table, None)
+                self._next_probe.pop(table, None)
+            now = time.time()
+            tables = [t for t in self._versions if self._next_probe.get(t, 0) <= now]
+        
+        for table in tables:
+            version = self._fetch_version(table)
+            with self._lock:
+                if table not in self._versions:
+                    continue
+                if version is None:
+                    # e.g. sources without table_snapshot(); 2x, 4x, ... the poll interval
+                    failures = self._failures[table] = self._failures.get(table, 0) + 1
+                    backoff = min(self.poll_seconds * 2 ** failures, self.max_backoff_seconds)
+                    self._next_probe[table] = time.time() + backoff
+                    continue
+                self._failures.pop(table, None)
+                self._next_probe.pop(table, None)
+                previous = self._versions[table]
+                self._versions[table] = version
+                changed = previous is not None and previous != version
+                if changed:
+                    self.changes += 1
+            if changed:
+                for callback in self._callbacks:
+                    callback(table)
+
+    def _fetch_version(self, table: str) -> Optional[str]:
+        # Background probes must not skew the queue_wait/dremio_execute latencies users see
+        with warehouse_request(None, PRIORITY_BACKGROUND), timed_stage("freshness_probe", table=table):
+            df, error = call_dremio_data_procedure(self.version_sql.format(table=table.replace("'", "''")), max_rows=1)
+        if df is None or df.empty or pd.isna(df.iat[0, 0]):
+            return None
+        return str(df.iat[0, 0])
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.poll()
+            except Exception:
+                pass
+
+def invalidate_table_results(table: str) -> None:
+    """Drop cached results and grid pages that read table."""
+    get_result_cache().invalidate_tag(table)
+    get_grid_page_cache().invalidate_tag(table)
+
+@st.cache_resource
+def get_freshness_monitor() -> TableFreshnessMonitor:
+    """Start the process-wide table freshness monitor on first use."""
+    monitor = TableFreshnessMonitor(
+        TABLE_FRESHNESS_POLL_SECONDS,
+        TABLE_FRESHNESS_SQL,
+        active_tables=lambda: get_result_cache().tags() | get_grid_page_cache().tags(),
+        max_backoff_seconds=TABLE_FRESHNESS_MAX_BACKOFF_SECONDS,
+    )
+    monitor.on_change(invalidate_table_results)
+    monitor.start()
+    return monitor
+
+def watch_query_tables(sql_statement: str) -> Dict[str, Optional[str]]:
+    """Track the tables sql_statement reads; call before running it and pass the result to cache_query_result."""
+    return get_freshness_monitor().watch(extract_table_references(sql_statement))
+
+def cache_query_result(
+    cache: LRUCache, key: Hashable, df: pd.DataFrame, versions: Dict[str, Optional[str]], owner: Optional[str]
+) -> None:
+    """Cache a query result tagged with the tables it reads.
+
+    Results whose tables all had a known version when the query started, and
+    still have it now, are kept for RESULT_CACHE_TRACKED_TTL_SECONDS, since a
+    later change to any of them drops the entry. A change noticed while the
+    query ran had no entry to drop, so such results (and results over tables
+    without a version) fall back to the cache's own TTL.
+    """
+    tracked = get_freshness_monitor().unchanged(versions)
+    ttl_seconds = RESULT_CACHE_TRACKED_TTL_SECONDS if tracked else None
+    cache.set(key, df, owner=owner, ttl_seconds=ttl_seconds, tags=tuple(versions))
+
+class ResultSnapshot:
+    """Compact Parquet-encoded copy of a query result stored with a chat message.
+
+    Snapshots are capped at ``SNAPSHOT_MAX_ROWS`` rows and live in memory until the
+    session's snapshot budget is exceeded, at which point they are spilled to disk.
+    ``truncated`` is True when the snapshot does not hold every row of the query.
+    """
+
+    def __init__(self, payload: bytes, rows: int, truncated: bool):
+        self.rows = rows
+        self.truncated = truncated
+        self.nbytes = len(payload)
+        self.path: Optional[str] = None
+        self._payload: Optional[bytes] = payload
+        self._finalizer: Optional[weakref.finalize] = None
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> Optional["ResultSnapshot"]:
+        """Encode df as a snapshot, or return None if it cannot be serialized."""
+        try:
+            buffer = io.BytesIO()
+            df.head(SNAPSHOT_MAX_ROWS).to_parquet(buffer, engine="pyarrow", compression=SNAPSHOT_COMPRESSION)
+        except Exception:
+            return None
+        rows = min(len(df), SNAPSHOT_MAX_ROWS)
+        snapshot = cls(buffer.getvalue(), rows, rows < len(df) or bool(df.attrs.get("truncated")))
+        if snapshot.nbytes > SNAPSHOT_SPILL_BYTES:
+            snapshot.spill()
+        return snapshot
+
+    @property
+    def in_memory(self) -> bool:
+        return self._payload is not None
+
+    def to_dataframe(self) -> Optional[pd.DataFrame]:
+        """Decode the snapshot back into a DataFrame."""
+        try:
+            source = io.BytesIO(self._payload) if self._payload is not None else self.path
+            return pd.read_parquet(source, engine="pyarrow")
+        except Exception:
+            return None
+
+    def spill(self) -> None:
+        """Move the encoded payload to a temporary file and release the memory."""
+        if self._payload is None:
+            return
+        os.makedirs(SNAPSHOT_SPILL_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".parquet", dir=SNAPSHOT_SPILL_DIR)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self._payload)
+        self.path = path
+        self._payload = None
+        self._finalizer = weakref.finalize(self, _remove_file, path)
+
+    def discard(self) -> None:
+        """Release the payload and delete any spill file."""
+        self._payload = None
+        if self._finalizer is not None:
+            self._finalizer()
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def enforce_snapshot_budget(messages: List[ChatMessage]) -> None:
+    """Spill the oldest in-memory snapshots until the session fits its snapshot budget."""
+    snapshots = [m.result for m in messages if m.result is not None and m.result.in_memory]
+    in_memory_bytes = sum(s.nbytes for s in snapshots)
+    for snapshot in snapshots:
+        if in_memory_bytes <= SESSION_SNAPSHOT_MAX_BYTES:
+            break
+        snapshot.spill()
+        in_memory_bytes -= snapshot.nbytes
+
+@dataclass(slots=True)
+class ChatMessage:
+    """One chat turn as kept in session state: only what rendering and context need.
+
+    Assistant messages keep the extracted text, SQL and suggestions rather than the
+    raw Cortex Analyst response; SQL and suggestions are interned so repeats across
+    turns and sessions share one string.
+    """
+    role: str
+    text: str
+    message_id: str
+    sql: Optional[str] = None
+    suggestions: Tuple[str, ...] = ()
+    result: Optional[ResultSnapshot] = None
+    sql_error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    context_json: Optional[Dict[str, str]] = None
+    trimmed: bool = False
+
+    @classmethod
+    def user(cls, question: str, message_id: str) -> "ChatMessage":
+        return cls("user", question, message_id)
+
+    @classmethod
+    def assistant(cls, text: str, message_id: str) -> "ChatMessage":
+        return cls("assistant", text, message_id)
+
+    @classmethod
+    def from_response(
+        cls,
+        response_content: Dict,
+        message_id: str,
+        result: Optional[ResultSnapshot] = None,
+        sql_error: Optional[str] = None,
+    ) -> "ChatMessage":
+        """Build an assistant message from a Cortex Analyst response."""
+        sql_statement = extract_sql_from_response(response_content)
+        return cls(
+            "assistant",
+            extract_text_from_response(response_content),
+            message_id,
+            sql=sys.intern(sql_statement) if sql_statement else None,
+            suggestions=tuple(sys.intern(s) for s in extract_suggestions_from_response(response_content)),
+            result=result,
+            sql_error=sql_error,
+        )
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the message's strings."""
+        strings = [self.text, self.sql or "", self.sql_error or "", *self.suggestions, *(self.context_json or {}).values()]
+        return sum(sys.getsizeof(value) for value in strings)
+
+    def trim(self) -> None:
+        """Drop the bulky parts of an old message, keeping its SQL so the result can be reloaded."""
+        if len(self.text) > CONTEXT_COMPACT_CHARS:
+            self.text = self.text[:CONTEXT_COMPACT_CHARS] + "..."
+        self.suggestions = ()
+        self.context_json = None
+        self.trimmed = True
+
+def enforce_history_budget(messages: List[ChatMessage]) -> None:
+    """Trim the oldest messages until the session's history fits SESSION_HISTORY_MAX_BYTES."""
+    total_bytes = sum(m.nbytes() for m in messages)
+    for message in messages[:-1]:
+        if total_bytes <= SESSION_HISTORY_MAX_BYTES:
+            break
+        if not message.trimmed:
+            before = message.nbytes()
+            message.trim()
+            total_bytes -= before - message.nbytes()
+
+def load_message_result(message: ChatMessage, sql_statement: str) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """Load the result for a history message: shared cache, then its snapshot, then Dremio."""
+    max_rows = get_row_limit(message.message_id)
+    df = get_result_cache().get(result_cache_key(sql_statement, max_rows))
+    if df is not None:
+        return df, None
+    
+    snapshot = message.result
+    if snapshot is not None and (snapshot.rows >= max_rows or not snapshot.truncated):
+        df = snapshot.to_dataframe()
+        if df is not None:
+            truncated = snapshot.truncated or len(df) > max_rows
+            if len(df) > max_rows:
+                df = df.head(max_rows)
+                df.attrs.pop("fingerprint", None)
+            df.attrs["truncated"] = "rows" if truncated else None
+            return df, None
+    
+    return fetch_query_result(sql_statement, owner=st.session_state.session_id, max_rows=max_rows)
+
+SQL_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<punct>[.,()])
+  | (?P<other>\S)
+""", re.VERBOSE | re.DOTALL)
+
+# Words that can follow a table reference and must not be read as an alias or name
+SQL_CLAUSE_WORDS = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "on", "using",
+    "group", "order", "limit", "offset", "fetch", "union", "except", "intersect", "minus", "having",
+    "qualify", "window", "as", "lateral", "select", "pivot", "unpivot", "sample", "tablesample",
+}
+
+# Functions whose arguments use FROM without naming a table
+SQL_FROM_FUNCTIONS = {"extract", "trim", "substring", "position", "overlay"}
+
+def tokenize_sql(sql_statement: str) -> List[Tuple[str, str]]:
+    """Split SQL into (kind, value) tokens, dropping comments and masking string literals.
+
+    Kinds are "ident" (bare or quoted identifier), "punct" and "other".
+    """
+    tokens = []
+    for match in SQL_TOKEN_PATTERN.finditer(sql_statement):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        if kind == "quoted":
+            tokens.append(("ident", match.group()[1:-1].replace('""', '"')))
+        elif kind == "word":
+            tokens.append(("ident", match.group()))
+        elif kind == "punct":
+            tokens.append(("punct", match.group()))
+        else:
+            tokens.append(("other", match.group()))
+    return tokens
+
+@functools.lru_cache(maxsize=SQL_ANALYSIS_CACHE_SIZE)
+def extract_table_references(sql_statement: str) -> Tuple[str, ...]:
+    """Lower-cased qualified names of the tables read by a statement, in order of appearance.
+
+    CTE names and table functions are skipped; subqueries are covered by their own FROM.
+    """
+    tokens = tokenize_sql(sql_statement)
+    words = [value.lower() if kind == "ident" else value for kind, value in tokens]
     
-    for keyword, display_name in source_mapping.items():
-        if keyword in sql_lower:
+    # Names defined by WITH ... AS ( are not physical tables
+    ctes = set()
+    for i in range(1, len(tokens) - 2):
+        if tokens[i][0] == "ident" and words[i + 1] == "as" and words[i + 2] == "(" and words[i - 1] in ("with", "recursive", ","):
+            ctes.add(words[i])
+    
+    tables: List[str] = []
+    paren_owners: List[str] = []
+    i = 0
+    while i < len(tokens):
+        word = words[i]
+        if word == "(":
+            paren_owners.append(words[i - 1] if i else "")
+        elif word == ")" and paren_owners:
+            paren_owners.pop()
+        elif word in ("from", "join") and tokens[i][0] == "ident":
+            if paren_owners and paren_owners[-1] in SQL_FROM_FUNCTIONS:
+                i += 1
+                continue
+            i += 1
+            while i < len(tokens):
+                parts = []
+                while i < len(tokens) and tokens[i][0] == "ident" and words[i] not in SQL_CLAUSE_WORDS:
+                    parts.append(words[i])
+                    if i + 1 < len(tokens) and words[i + 1] == ".":
+                        i += 2
+                    else:
+                        i += 1
+                        break
+                if not parts or (i < len(tokens) and words[i] == "("):
+                    break  # subquery or table function
+                name = ".".join(parts)
+                if name not in ctes and name not in tables:
+                    tables.append(name)
+                # Optional alias
+                if i < len(tokens) and words[i] == "as":
+                    i += 1
+                if i < len(tokens) and tokens[i][0] == "ident" and words[i] not in SQL_CLAUSE_WORDS:
+                    i += 1
+                # Comma-separated FROM list
+                if word == "from" and i < len(tokens) and words[i] == ",":
+                    i += 1
+                    continue
+                break
+            continue
+        i += 1
+    return tuple(tables)
+
+def match_data_source(table: str) -> List[str]:
+    """Sources from DATA_SOURCE_CATALOG that a qualified table name belongs to.
+
+    Catalog keys containing a dot match as a qualified-name prefix; other keys
+    match whole underscore-separated words of any name part.
+    """
+    words = {word for part in table.split(".") for word in part.split("_")}
+    sources = []
+    for key, display_name in DATA_SOURCE_CATALOG.items():
+        matched = (table == key or table.startswith(key + ".")) if "." in key else key in words
+        if matched and display_name not in sources:
             sources.append(display_name)
+    return sources
+
+def match_table_hint(table: str) -> Optional[str]:
+    """Source suggested by a table's own name via DATA_SOURCE_TABLE_HINTS."""
+    for word in table.split(".")[-1].split("_"):
+        singular = word[:-3] + "y" if word.endswith("ies") else word.rstrip("s")
+        for candidate in (word, singular):
+            if candidate in DATA_SOURCE_TABLE_HINTS:
+                return DATA_SOURCE_TABLE_HINTS[candidate]
+    return None
+
+def identify_data_sources_from_sql(sql_statement: str) -> List[str]:
+    """Identify data sources from the tables a SQL statement reads."""
+    tables = extract_table_references(sql_statement)
+    
+    sources = []
+    for table in tables:
+        for display_name in match_data_source(table):
+            if display_name not in sources:
+                sources.append(display_name)
     
-    # If no specific source found, try to infer from schema/table names
+    # If no schema matched the catalog, infer from table names
     if not sources:
-        if any(term in sql_lower for term in ['account', 'opportunity', 'lead', 'contact']):
-            sources.append('🔹 Salesforce')
-        elif any(term in sql_lower for term in ['partner', 'product', 'stock']):
-            sources.append('🟦 Odoo')
+        for table in tables:
+            display_name = match_table_hint(table)
+            if display_name and display_name not in sources:
+                sources.append(display_name)
+    
+    return sources or [DEFAULT_DATA_SOURCE]
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of threshold points that preserve the line's shape."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[anchor] - avg_x) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (avg_y - y[anchor])
+        )
+        anchor = start + int(area.argmax())
+        selected[i + 1] = anchor
+    return selected
+
+def lttb_downsample(chart_data: pd.DataFrame, x_col: str, y_col: str, max_points: int) -> pd.DataFrame:
+    """Downsample a line series to max_points, sorted by x."""
+    ordered = chart_data.sort_values(x_col, kind="mergesort")
+    if not pd.api.types.is_numeric_dtype(ordered[y_col]):
+        step = int(np.ceil(len(ordered) / max_points))
+        return ordered.iloc[::step]
+    
+    x_values = ordered[x_col]
+    if pd.api.types.is_datetime64_any_dtype(x_values):
+        x = x_values.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+    elif pd.api.types.is_numeric_dtype(x_values):
+        x = x_values.to_numpy(dtype=np.float64)
+    else:
+        x = np.arange(len(ordered), dtype=np.float64)
+    y = ordered[y_col].to_numpy(dtype=np.float64)
+    return ordered.iloc[lttb_indices(x, y, max_points)]
+
+def top_k_with_other(chart_data: pd.DataFrame, x_col: str, y_col: str, k: int) -> pd.DataFrame:
+    """Sum y per x category, keeping the k largest and folding the rest into "Other"."""
+    totals = chart_data.groupby(x_col, sort=False)[y_col].sum().sort_values(ascending=False)
+    if len(totals) > k:
+        other_total = totals.iloc[k:].sum()
+        totals = totals.iloc[:k]
+        totals.index = totals.index.astype(str)
+        totals = pd.concat([totals, pd.Series({"Other": other_total})])
+    return totals.rename_axis(x_col).rename(y_col).reset_index()
+
+def histogram_bins(values: pd.Series, bins: int) -> pd.DataFrame:
+    """Pre-bin a numeric series into bins for a compact histogram spec."""
+    counts, edges = np.histogram(values.to_numpy(dtype=np.float64), bins=bins)
+    return pd.DataFrame({"bin_start": edges[:-1], "bin_end": edges[1:], "count": counts})
+
+def box_plot_summary(chart_data: pd.DataFrame, x_col: str, y_col: str, max_groups: int) -> pd.DataFrame:
+    """Five-number summary of y per x group, limited to the max_groups largest groups."""
+    largest = chart_data[x_col].value_counts().index[:max_groups]
+    subset = chart_data[chart_data[x_col].isin(largest)]
+    summary = subset.groupby(x_col)[y_col].quantile([0.0, 0.25, 0.5, 0.75, 1.0]).unstack()
+    summary.columns = ["min", "q1", "median", "q3", "max"]
+    return summary.reset_index()
+
+@dataclass
+class ChartSpec:
+    """A built chart that can be rendered again without touching the source DataFrame."""
+    kind: str  # "vega_lite", "line", "bar" or "metric"
+    payload: Any
+    source_rows: int
+    reduction: Optional[str] = None
+
+def chart_spec_size(spec: ChartSpec) -> int:
+    """Approximate memory held by a cached chart spec."""
+    if spec.kind == "vega_lite":
+        return len(json.dumps(spec.payload, default=str))
+    if spec.kind in ("line", "bar"):
+        return dataframe_size_bytes(spec.payload)
+    return 256
+
+@st.cache_resource
+def get_chart_cache() -> LRUCache:
+    """Process-wide cache of chart specs keyed by result content and chart selection."""
+    return LRUCache(max_bytes=CHART_CACHE_MAX_BYTES, size_of=chart_spec_size)
+
+def result_fingerprint(df: pd.DataFrame) -> str:
+    """Content hash of a result, memoized on the frame so reruns do not rehash it."""
+    cached = df.attrs.get("fingerprint")
+    if cached and cached.get("shape") == list(df.shape):
+        return cached["digest"]
+    
+    digest = hashlib.sha1(repr((list(df.columns), [str(t) for t in df.dtypes])).encode())
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=False)
+    except TypeError:
+        # Unhashable cell values (lists, dicts) - fall back to their string form
+        row_hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+    digest.update(row_hashes.to_numpy().tobytes())
+    
+    df.attrs["fingerprint"] = {"shape": list(df.shape), "digest": digest.hexdigest()}
+    return df.attrs["fingerprint"]["digest"]
+
+@dataclass(frozen=True)
+class ColumnProfile:
+    """Chart-relevant summary of one result column."""
+    kind: str  # "numeric", "temporal", "categorical" or "empty"
+    distinct: int
+    monotonic: bool
+
+@dataclass(frozen=True)
+class ResultProfile:
+    """Column profiles of a result, computed once per result content."""
+    rows: int
+    columns: Dict[str, ColumnProfile]
+
+    def of_kind(self, kind: str) -> List[str]:
+        return [name for name, column in self.columns.items() if column.kind == kind]
+
+@st.cache_resource
+def get_profile_cache() -> LRUCache:
+    """Process-wide cache of result profiles keyed by result content."""
+    return LRUCache(max_bytes=PROFILE_CACHE_MAX_ENTRIES)
+
+def column_kind(series: pd.Series) -> str:
+    """Classify a column from its dtype, sampling object columns for dates."""
+    if pd.api.types.is_bool_dtype(series):
+        return "categorical"
+    if pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "temporal"
+    sample = series.dropna().head(PROFILE_TEMPORAL_SAMPLE)
+    if pd.api.types.infer_dtype(sample, skipna=True) in ("date", "datetime", "datetime64"):
+        return "temporal"
+    return "categorical"
+
+def profile_result(df: pd.DataFrame) -> ResultProfile:
+    """Dtype, cardinality and monotonicity of every column, cached per result."""
+    cache = get_profile_cache()
+    key = result_fingerprint(df)
+    profile = cache.get(key)
+    if profile is not None:
+        return profile
+
+    with timed_span("chart_profile", rows=len(df), columns=len(df.columns)):
+        try:
+            distinct = df.nunique(dropna=True)
+        except TypeError:
+            distinct = df.astype(str).nunique(dropna=True)
+        columns = {}
+        for name in df.columns:
+            series = df[name]
+            kind = column_kind(series) if distinct[name] else "empty"
+            monotonic = False
+            if kind in ("numeric", "temporal"):
+                try:
+                    monotonic = series.is_monotonic_increasing or series.is_monotonic_decreasing
+                except TypeError:
+                    pass
+            columns[name] = ColumnProfile(kind, int(distinct[name]), bool(monotonic))
+        profile = ResultProfile(len(df), columns)
+    cache.set(key, profile)
+    return profile
+
+def recommend_chart(profile: ResultProfile) -> Tuple[str, str, str]:
+    """Default (x column, y column, chart type) for a profiled result."""
+    names = list(profile.columns)
+    numeric = profile.of_kind("numeric")
+    temporal = profile.of_kind("temporal")
+    categorical = profile.of_kind("categorical")
+    # Monotonic numbers are usually IDs or row counters rather than measures
+    measures = [name for name in numeric if not profile.columns[name].monotonic] + [
+        name for name in numeric if profile.columns[name].monotonic
+    ]
+
+    if numeric and profile.rows == 1:
+        x_col = next(name for name in names if name != measures[0])
+        return x_col, measures[0], "Number Chart 🔢"
+    if temporal and numeric:
+        x_col = next((name for name in temporal if profile.columns[name].monotonic), temporal[0])
+        return x_col, measures[0], "Line Chart 📈"
+    if categorical and numeric:
+        # The coarsest grouping reads best; high-cardinality ones are folded into top K anyway
+        x_col = min(categorical, key=lambda name: profile.columns[name].distinct)
+        chart_type = "Pie Chart 🥧" if profile.columns[x_col].distinct <= PIE_TOP_K and len(numeric) == 1 else "Bar Chart 📊"
+        return x_col, measures[0], chart_type
+    if len(numeric) >= 2:
+        x_col = next((name for name in numeric if profile.columns[name].monotonic), None)
+        if x_col is not None:
+            return x_col, next(name for name in measures if name != x_col), "Line Chart 📈"
+        return measures[0], measures[1], "Scatter Plot 🔵"
+    if numeric:
+        x_col = next(name for name in names if name != numeric[0])
+        return x_col, numeric[0], "Histogram 📊"
+    # Nothing numeric to plot; chart_block_reason explains why
+    return names[0], names[1], "Bar Chart 📊"
+
+def chart_block_reason(profile: ResultProfile, x_col: str, y_col: str, chart_type: str) -> Optional[str]:
+    """Why a selection would produce an unreadable or very slow chart, or None if it is fine."""
+    x, y = profile.columns[x_col], profile.columns[y_col]
+    if x.kind == "empty" or y.kind == "empty":
+        return f"{x_col if x.kind == 'empty' else y_col} has no values to chart."
+    if y.kind != "numeric":
+        if not profile.of_kind("numeric"):
+            return "This result has no numeric column to chart."
+        return f"{chart_type} needs a numeric Y axis, and {y_col} is not numeric."
+    if (
+        x.kind == "categorical"
+        and x.distinct > CHART_MAX_CATEGORIES
+        and chart_type in ("Line Chart 📈", "Scatter Plot 🔵", "Box Plot 📦", "Combo Chart 🔀")
+    ):
+        return f"{x_col} has {x.distinct:,} distinct text values, too many for a {chart_type}."
+    return None
+
+def build_chart_spec(df: pd.DataFrame, x_col: str, y_col: str, chart_type: str) -> ChartSpec:
+    """Reduce the selected columns and build the chart for chart_type."""
+    chart_data = df[[x_col, y_col]].dropna()
+    source_rows = len(chart_data)
+    oversized = source_rows > CHART_MAX_POINTS
+    y_numeric = pd.api.types.is_numeric_dtype(chart_data[y_col])
+    reduction = None
+
+    if chart_type == "Line Chart 📈":
+        if oversized:
+            chart_data = lttb_downsample(chart_data, x_col, y_col, CHART_MAX_POINTS)
+            reduction = f"downsampled to {len(chart_data):,} points" + (" (LTTB)" if y_numeric else "")
+        return ChartSpec("line", chart_data.set_index(x_col), source_rows, reduction)
+
+    elif chart_type == "Bar Chart 📊":
+        if oversized and y_numeric:
+            chart_data = top_k_with_other(chart_data, x_col, y_col, BAR_TOP_K)
+            reduction = f"summed per {x_col}" + (f" (top {BAR_TOP_K} plus Other)" if len(chart_data) > BAR_TOP_K else "")
+        elif oversized:
+            chart_data = chart_data.head(CHART_MAX_POINTS)
+            reduction = f"limited to the first {CHART_MAX_POINTS:,} rows"
+        return ChartSpec("bar", chart_data.set_index(x_col), source_rows, reduction)
+
+    elif chart_type == "Pie Chart 🥧":
+        if y_numeric and (oversized or chart_data[x_col].nunique() > PIE_TOP_K):
+            chart_data = top_k_with_other(chart_data, x_col, y_col, PIE_TOP_K)
+            reduction = f"summed per {x_col}" + (f" (top {PIE_TOP_K} plus Other)" if len(chart_data) > PIE_TOP_K else "")
+        chart = alt.Chart(chart_data).mark_arc().encode(
+            theta=alt.Theta(field=y_col, type="quantitative"),
+            color=alt.Color(field=x_col, type="nominal")
+        )
+
+    elif chart_type == "Scatter Plot 🔵":
+        if oversized:
+            chart_data = chart_data.sample(n=CHART_MAX_POINTS, random_state=0)
+            reduction = f"randomly sampled to {CHART_MAX_POINTS:,} points"
+        chart = alt.Chart(chart_data).mark_circle(size=60).encode(
+            x=x_col,
+            y=y_col,
+            tooltip=[x_col, y_col]
+        ).interactive()
+
+    elif chart_type == "Histogram 📊":
+        if oversized and y_numeric:
+            bins = histogram_bins(chart_data[y_col], HISTOGRAM_BINS)
+            reduction = f"pre-binned into {HISTOGRAM_BINS} bins"
+            chart = alt.Chart(bins).mark_bar().encode(
+                alt.X("bin_start:Q", bin="binned", title=y_col),
+                alt.X2("bin_end:Q"),
+                alt.Y("count:Q", title="Count of Records")
+            )
         else:
-            sources.append('🏢 Data Warehouse')
+            if oversized:
+                chart_data = chart_data.head(CHART_MAX_POINTS)
+                reduction = f"limited to the first {CHART_MAX_POINTS:,} rows"
+            chart = alt.Chart(chart_data).mark_bar().encode(
+                alt.X(y_col, bin=True),
+                y='count()'
+            )
+
+    elif chart_type == "Box Plot 📦":
+        if oversized and y_numeric:
+            summary = box_plot_summary(chart_data, x_col, y_col, BAR_TOP_K)
+            reduction = f"summarized as quantiles per {x_col}"
+            base = alt.Chart(summary).encode(x=alt.X(f"{x_col}:N"))
+            whiskers = base.mark_rule().encode(y=alt.Y("min:Q", title=y_col), y2="max:Q")
+            boxes = base.mark_bar(size=20).encode(y="q1:Q", y2="q3:Q")
+            medians = base.mark_tick(color="white", size=20).encode(y="median:Q")
+            chart = whiskers + boxes + medians
+        else:
+            if oversized:
+                chart_data = chart_data.head(CHART_MAX_POINTS)
+                reduction = f"limited to the first {CHART_MAX_POINTS:,} rows"
+            chart = alt.Chart(chart_data).mark_boxplot().encode(
+                x=x_col,
+                y=y_col
+            )
+
+    elif chart_type == "Combo Chart 🔀":
+        if oversized:
+            chart_data = lttb_downsample(chart_data, x_col, y_col, CHART_MAX_POINTS)
+            reduction = f"downsampled to {len(chart_data):,} points" + (" (LTTB)" if y_numeric else "")
+        line = alt.Chart(chart_data).mark_line(color='blue').encode(x=x_col, y=y_col)
+        bar = alt.Chart(chart_data).mark_bar(opacity=0.3).encode(x=x_col, y=y_col)
+        chart = bar + line
+
+    elif chart_type == "Number Chart 🔢":
+        return ChartSpec("metric", (f"{y_col} Total", round(chart_data[y_col].sum(), 2)), source_rows)
+
+    else:
+        raise ValueError(f"Unknown chart type: {chart_type}")
+
+    # Serialize once; cached specs are rendered straight from this dict
+    return ChartSpec("vega_lite", chart.to_dict(), source_rows, reduction)
+
+def render_chart_spec(spec: ChartSpec) -> None:
+    """Draw a chart spec built by build_chart_spec."""
+    if spec.kind == "line":
+        st.line_chart(spec.payload)
+    elif spec.kind == "bar":
+        st.bar_chart(spec.payload)
+    elif spec.kind == "metric":
+        label, value = spec.payload
+        st.metric(label=label, value=value)
+    else:
+        st.vega_lite_chart(spec.payload, use_container_width=True)
     
-    return sources
+    if spec.reduction:
+        st.caption(f"📉 {spec.source_rows:,} rows {spec.reduction} for charting.")
 
 def display_charts_tab(df: pd.DataFrame, key_suffix: str) -> None:
     """Display various charts based on the DataFrame using unique keys."""
     if len(df.columns) >= 2:
         all_cols = list(df.columns)
+        profile = profile_result(df)
+        rec_x, rec_y, rec_chart = recommend_chart(profile)
 
         col1, col2 = st.columns(2)
-        x_col = col1.selectbox("X axis", all_cols, key=f"x_col_{key_suffix}")
+        x_col = col1.selectbox("X axis", all_cols, index=all_cols.index(rec_x), key=f"x_col_{key_suffix}")
+        y_options = [col for col in all_cols if col != x_col]
         y_col = col2.selectbox(
-            "Y axis", [col for col in all_cols if col != x_col], key=f"y_col_{key_suffix}"
+            "Y axis",
+            y_options,
+            index=y_options.index(rec_y) if rec_y in y_options else 0,
+            key=f"y_col_{key_suffix}"
         )
 
         chart_type = st.selectbox(
             "Select chart type",
-            [
-                "Line Chart 📈", "Bar Chart 📊", "Pie Chart 🥧", "Scatter Plot 🔵",
-                "Histogram 📊", "Box Plot 📦", "Combo Chart 🔀", "Number Chart 🔢"
-            ],
+            CHART_TYPES,
+            index=CHART_TYPES.index(rec_chart),
             key=f"chart_type_{key_suffix}"
         )
 
-        chart_data = df[[x_col, y_col]].dropna()
+        # Refuse selections that would hand Altair e.g. one line point per 50k text labels
+        blocked = chart_block_reason(profile, x_col, y_col, chart_type)
+        if blocked:
+            if chart_block_reason(profile, rec_x, rec_y, rec_chart) is None:
+                blocked += f" Try a {rec_chart} of {rec_y} by {rec_x}."
+            st.warning(f"⚠️ {blocked}")
+            return
 
-        if chart_type == "Line Chart 📈":
-            st.line_chart(chart_data.set_index(x_col))
+        # Unchanged (result, axes, chart type) combinations reuse the built spec
+        chart_cache = get_chart_cache()
+        cache_key = (result_fingerprint(df), x_col, y_col, chart_type)
+        spec = chart_cache.get(cache_key)
+        if spec is None:
+            with timed_span("chart_build", chart_type=chart_type) as span:
+                spec = build_chart_spec(df, x_col, y_col, chart_type)
+                span["rows"] = spec.source_rows
+                span["bytes"] = chart_spec_size(spec)
+            chart_cache.set(cache_key, spec)
+        render_chart_spec(spec)
 
-        elif chart_type == "Bar Chart 📊":
-            st.bar_chart(chart_data.set_index(x_col))
+    else:
+        st.warning("⚠️ At least 2 columns are required to render a chart.")
 
-        elif chart_type == "Pie Chart 🥧":
-            pie = alt.Chart(chart_data).mark_arc().encode(
-                theta=alt.Theta(field=y_col, type="quantitative"),
-                color=alt.Color(field=x_col, type="nominal")
-            )
-            st.altair_chart(pie, use_container_width=True)
+def display_load_more(df: pd.DataFrame, message_id: str) -> None:
+    """Explain a cut-off result and offer to fetch the next page of rows."""
+    truncated = df.attrs.get("truncated")
+    if not truncated:
+        return
+    
+    if truncated == "bytes":
+        st.caption(f"✂️ Result stopped at {RESULT_MAX_BYTES // (1024 * 1024)} MB. Add filters to narrow it down.")
+        return
+    
+    # Only the result cache keeps a grown result across reruns (snapshots hold the first page),
+    # so rows it would refuse to store would be fetched from Dremio again on every rerun
+    max_rows = min(RESULT_MAX_ROWS, cacheable_rows(df))
+    if len(df) >= max_rows:
+        st.caption(f"✂️ Result capped at {len(df):,} rows. Add filters to narrow it down.")
+        return
+    
+    st.caption(f"ℹ️ Showing the first {len(df):,} rows; more are available.")
+    # A callback (rather than st.rerun) keeps this working inside fragments
+    st.button(
+        "⬇️ Load more rows",
+        key=f"load_more_{message_id}",
+        on_click=increase_row_limit,
+        args=(message_id, len(df), max_rows)
+    )
 
-        elif chart_type == "Scatter Plot 🔵":
-            scatter = alt.Chart(chart_data).mark_circle(size=60).encode(
-                x=x_col,
-                y=y_col,
-                tooltip=[x_col, y_col]
-            ).interactive()
-            st.altair_chart(scatter, use_container_width=True)
+def cacheable_rows(df: pd.DataFrame) -> int:
+    """Most rows of a result shaped like df that one session can keep in the result cache."""
+    bytes_per_row = dataframe_size_bytes(df) / max(len(df), 1)
+    if not bytes_per_row:
+        return RESULT_MAX_ROWS
+    return int(RESULT_CACHE_SESSION_MAX_BYTES // bytes_per_row)
 
-        elif chart_type == "Histogram 📊":
-            hist = alt.Chart(chart_data).mark_bar().encode(
-                alt.X(y_col, bin=True),
-                y='count()'
-            )
-            st.altair_chart(hist, use_container_width=True)
+def increase_row_limit(message_id: str, current_rows: int, max_rows: int = RESULT_MAX_ROWS) -> None:
+    """Request the next page of rows for a message's result, up to max_rows."""
+    st.session_state.row_limits[message_id] = min(current_rows + RESULT_PAGE_ROWS, max_rows)
 
-        elif chart_type == "Box Plot 📦":
-            box = alt.Chart(chart_data).mark_boxplot().encode(
-                x=x_col,
-                y=y_col
-            )
-            st.altair_chart(box, use_container_width=True)
+@dataclass(frozen=True)
+class GridQuery:
+    """Sort, filter and page position of the warehouse-backed result grid."""
+    sort_column: Optional[str] = None
+    descending: bool = False
+    filter_column: Optional[str] = None
+    filter_operator: str = "contains"
+    filter_value: str = ""
+    numeric_filter: bool = False
+    page: int = 0
+    columns: Tuple[str, ...] = ()  # result columns, used to order pages deterministically
+
+def quote_identifier(name: str) -> str:
+    """Quote a column name for use in generated SQL."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def grid_filter_clause(query: GridQuery) -> Optional[str]:
+    """WHERE condition for the grid's filter, or None if no filter is set."""
+    value = query.filter_value.strip()
+    if not query.filter_column or not value or query.filter_operator not in GRID_FILTER_OPERATORS:
+        return None
+    
+    column = quote_identifier(query.filter_column)
+    if query.filter_operator == "contains":
+        pattern = value.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("'", "''")
+        return f"LOWER(CAST({column} AS VARCHAR)) LIKE '%{pattern}%' ESCAPE '\\'"
+    
+    if query.numeric_filter:
+        try:
+            literal = repr(float(value))
+        except ValueError:
+            return None
+    else:
+        literal = "'" + value.replace("'", "''") + "'"
+    return f"{column} {query.filter_operator} {literal}"
 
-        elif chart_type == "Combo Chart 🔀":
-            line = alt.Chart(chart_data).mark_line(color='blue').encode(x=x_col, y=y_col)
-            bar = alt.Chart(chart_data).mark_bar(opacity=0.3).encode(x=x_col, y=y_col)
-            combo = bar + line
-            st.altair_chart(combo, use_container_width=True)
+ORDER_BY_ITEM_PATTERN = re.compile(
+    r'^\s*(?:(?P<position>\d+)|"(?P<quoted>(?:[^"]|"")+)"|(?P<word>[A-Za-z_][A-Za-z0-9_$]*))'
+    r'(?P<direction>\s+(?:asc|desc))?(?P<nulls>\s+nulls\s+(?:first|last))?\s*$',
+    re.IGNORECASE,
+)
 
-        elif chart_type == "Number Chart 🔢":
-            st.metric(label=f"{y_col} Total", value=round(chart_data[y_col].sum(), 2))
+def statement_order_by(sql_statement: str, columns: Sequence[str]) -> Optional[str]:
+    """The statement's own top-level ORDER BY, rewritten against its output columns.
 
+    Returns None when there is none or when a key is an expression that the
+    outer grid query cannot see (e.g. ``ORDER BY p.name`` or ``SUM(x)``).
+    """
+    normalized = normalize_sql(sql_statement)
+    tokens = list(SQL_TOKEN_PATTERN.finditer(normalized))
+    depth = 0
+    start = end = None
+    for i, token in enumerate(tokens):
+        value = token.group()
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif depth == 0 and token.lastgroup == "word":
+            word = value.lower()
+            if word == "order" and i + 1 < len(tokens) and tokens[i + 1].group().lower() == "by":
+                start, end = tokens[i + 1].end(), None
+            elif word in ("union", "except", "intersect", "minus"):
+                start = end = None
+            elif word in ("limit", "offset", "fetch") and start is not None and end is None:
+                end = token.start()
+    if start is None:
+        return None
+    
+    keys = []
+    for item in normalized[start:end].split(","):
+        match = ORDER_BY_ITEM_PATTERN.match(item)
+        if not match:
+            return None
+        if match.group("position"):
+            if not 1 <= int(match.group("position")) <= len(columns):
+                return None
+            key = match.group("position")
+        elif match.group("quoted"):
+            name = match.group("quoted").replace('""', '"')
+            if name not in columns:
+                return None
+            key = quote_identifier(name)
+        else:
+            # Unquoted names are case-insensitive
+            name = next((column for column in columns if str(column).upper() == match.group("word").upper()), None)
+            if name is None:
+                return None
+            key = quote_identifier(name)
+        keys.append(key + (match.group("direction") or "").upper() + (match.group("nulls") or "").upper())
+    return ", ".join(keys)
+
+def build_grid_sql(sql_statement: str, query: GridQuery, page_rows: int) -> str:
+    """Wrap a generated statement to fetch one filtered, sorted page (plus one look-ahead row).
+
+    An ORDER BY inside the subquery does not order the outer query, so the
+    statement's own ordering is repeated outside when no sort column is chosen,
+    and every column is appended as a tie-breaker to keep OFFSET pages stable.
+    """
+    parts = [f"SELECT * FROM ({normalize_sql(sql_statement)}) AS grid_result"]
+    condition = grid_filter_clause(query)
+    if condition:
+        parts.append(f"WHERE {condition}")
+    order = []
+    if query.sort_column:
+        order.append(f"{quote_identifier(query.sort_column)} {'DESC' if query.descending else 'ASC'}")
     else:
-        st.warning("⚠️ At least 2 columns are required to render a chart.")
+        own_order = statement_order_by(sql_statement, query.columns)
+        if own_order:
+            order.append(own_order)
+    order.extend(quote_identifier(column) for column in query.columns)
+    if order:
+        parts.append(f"ORDER BY {', '.join(order)}")
+    parts.append(f"LIMIT {page_rows + 1} OFFSET {query.page * page_rows}")
+    return " ".join(parts)
 
-def create_visualization_with_tabs(df: pd.DataFrame, sql_statement: str, data_sources: List[str] = None) -> None:
-    """Create visualization with data and chart tabs using logic from second code."""
+@st.cache_resource
+def get_grid_page_cache() -> LRUCache:
+    """Process-wide cache of grid pages keyed by the page's SQL."""
+    return LRUCache(
+        max_bytes=GRID_CACHE_MAX_BYTES,
+        ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+        owner_max_bytes=RESULT_CACHE_SESSION_MAX_BYTES,
+        size_of=dataframe_size_bytes,
+    )
+
+def fetch_grid_page(
+    sql_statement: str, query: GridQuery, owner: Optional[str] = None
+) -> Tuple[Optional[pd.DataFrame], bool, Optional[str]]:
+    """Return one grid page and whether another page follows it."""
+    page_sql = build_grid_sql(sql_statement, query, GRID_PAGE_ROWS)
+    cache = get_grid_page_cache()
+    key = result_cache_key(page_sql, GRID_PAGE_ROWS + 1)
+    
+    df = cache.get(key)
+    if df is None:
+        def run_and_cache():
+            versions = watch_query_tables(sql_statement)
+            df, error = call_dremio_data_procedure(page_sql, GRID_PAGE_ROWS + 1)
+            if df is not None:
+                cache_query_result(cache, key, df, versions, owner)
+            return df, error
+        
+        request = current_warehouse_request.get() or WarehouseRequest()
+        try:
+            get_scheduler().admit(request)
+        except AdmissionError as e:
+            return None, False, f"Dremio busy: {str(e)}"
+        df, error = get_single_flights()["dremio"].do(key, run_and_cache, waiter=request)
+        if df is None:
+            return None, False, error
+    
+    return df.head(GRID_PAGE_ROWS), len(df) > GRID_PAGE_ROWS, None
+
+def prefetch_grid_page(sql_statement: str, query: GridQuery, owner: Optional[str]) -> None:
+    """Fetch a page in the background unless it is already cached."""
+    page_sql = build_grid_sql(sql_statement, query, GRID_PAGE_ROWS)
+    if result_cache_key(page_sql, GRID_PAGE_ROWS + 1) not in get_grid_page_cache():
+        def prefetch():
+            with warehouse_request(owner, PRIORITY_BACKGROUND):
+                fetch_grid_page(sql_statement, query, owner)
+        
+        # A click on "next" while this runs joins it through the single-flight
+        get_query_executor().submit(prefetch)
+
+def set_grid_page(message_id: str, page: int) -> None:
+    """Move a result grid to page (also used to reset it when sort or filter change)."""
+    st.session_state.grid_pages[message_id] = max(page, 0)
+
+def display_result_grid(df: pd.DataFrame, sql_statement: str, message_id: str) -> None:
+    """Browse a result page by page with sorting and filtering pushed down to Dremio."""
+    columns = list(df.columns)
+    reset = {"on_change": set_grid_page, "args": (message_id, 0)}
+    
+    col1, col2, col3, col4, col5 = st.columns([3, 2, 3, 2, 3])
+    sort_column = col1.selectbox(
+        "Sort by", [None] + columns, format_func=lambda c: "(as returned)" if c is None else c,
+        key=f"grid_sort_{message_id}", **reset
+    )
+    descending = col2.selectbox("Order", ["Ascending", "Descending"], key=f"grid_order_{message_id}", **reset) == "Descending"
+    filter_column = col3.selectbox(
+        "Filter column", [None] + columns, format_func=lambda c: "(no filter)" if c is None else c,
+        key=f"grid_filter_column_{message_id}", **reset
+    )
+    filter_operator = col4.selectbox("Operator", GRID_FILTER_OPERATORS, key=f"grid_filter_op_{message_id}", **reset)
+    filter_value = col5.text_input("Value", key=f"grid_filter_value_{message_id}", **reset)
+    
+    query = GridQuery(
+        sort_column=sort_column,
+        descending=descending,
+        filter_column=filter_column,
+        filter_operator=filter_operator,
+        filter_value=filter_value,
+        numeric_filter=filter_column is not None and pd.api.types.is_numeric_dtype(df[filter_column]),
+        page=st.session_state.grid_pages.get(message_id, 0),
+        columns=tuple(columns),
+    )
+    owner = st.session_state.session_id
+    
+    with st.spinner("Loading page from Dremio..."), warehouse_request(owner, PRIORITY_INTERACTIVE):
+        page_df, has_next, error = fetch_grid_page(sql_statement, query, owner)
+    if error:
+        st.error(f"❌ **Page query failed:** {error}")
+        return
+    
+    st.dataframe(page_df, use_container_width=True)
+    first_row = query.page * GRID_PAGE_ROWS
+    if page_df.empty:
+        st.caption("📊 No rows match this filter.")
+    else:
+        st.caption(f"📊 Page {query.page + 1} • rows {first_row + 1:,}–{first_row + len(page_df):,}")
+    
+    prev_col, next_col = st.columns(2)
+    prev_col.button(
+        "⬅️ Previous page", key=f"grid_prev_{message_id}", disabled=query.page == 0,
+        on_click=set_grid_page, args=(message_id, query.page - 1), use_container_width=True
+    )
+    next_col.button(
+        "Next page ➡️", key=f"grid_next_{message_id}", disabled=not has_next,
+        on_click=set_grid_page, args=(message_id, query.page + 1), use_container_width=True
+    )
+    
+    if has_next:
+        prefetch_grid_page(sql_statement, replace(query, page=query.page + 1), owner)
+
+def open_export_writer(path: str, file_format: str, schema: pa.Schema):
+    """Parquet or Arrow IPC file writer for schema."""
+    if file_format == "parquet":
+        return pq.ParquetWriter(path, schema, compression=SNAPSHOT_COMPRESSION or "none")
+    return pa.ipc.new_file(path, schema)
+
+def rewrite_export(path: str, file_format: str, schema: pa.Schema):
+    """Copy the batches written so far into a new file with a wider schema; returns its open writer."""
+    previous = f"{path}.narrow"
+    os.replace(path, previous)
+    writer = open_export_writer(path, file_format, schema)
+    try:
+        if file_format == "parquet":
+            written = pq.ParquetFile(previous).iter_batches()
+        else:
+            reader = pa.ipc.open_file(previous)
+            written = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        for record_batch in written:
+            writer.write_table(pa.Table.from_batches([record_batch]).cast(schema))
+    except BaseException:
+        writer.close()
+        raise
+    finally:
+        _remove_file(previous)
+    return writer
+
+def write_export(batches, path: str, file_format: str) -> int:
+    """Append pandas batches to an export file one at a time; returns the rows written."""
+    rows = 0
+    if file_format == "csv.gz":
+        with gzip.open(path, "wt", newline="") as f:
+            for i, batch in enumerate(batches):
+                batch.to_csv(f, index=False, header=i == 0)
+                rows += len(batch)
+        return rows
+    
+    writer, schema = None, None
+    try:
+        for batch in batches:
+            table = pa.Table.from_pandas(batch, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = open_export_writer(path, file_format, schema)
+            elif not table.schema.equals(schema):
+                # A column that was all-null or integer so far may turn out to hold strings or floats
+                widened = pa.unify_schemas([schema, table.schema], promote_options="permissive")
+                if not widened.equals(schema):
+                    writer.close()
+                    writer = rewrite_export(path, file_format, widened)
+                    schema = widened
+            writer.write_table(table.cast(schema))
+            rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    if writer is None:
+        empty = pa.table({})
+        if file_format == "parquet":
+            pq.write_table(empty, path)
+        else:
+            with pa.ipc.new_file(path, empty.schema) as empty_writer:
+                empty_writer.write_table(empty)
+    return rows
+
+def export_query_result(sql_statement: str, file_format: str, owner: Optional[str] = None) -> bytes:
+    """Run sql_statement and encode up to EXPORT_MAX_ROWS rows of its result as file_format.
+
+    Batches are written to a temporary file as Dremio returns them, so the result
+    is never held as one DataFrame; only the encoded file is read back.
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=f".{file_format}", dir=EXPORT_DIR)
+    os.close(fd)
+    try:
+        limited_sql = apply_row_limit(sql_statement, EXPORT_MAX_ROWS)
+        request = WarehouseRequest(owner, PRIORITY_INTERACTIVE)
+        with get_scheduler().slot(request), timed_span("export", format=file_format) as span:
+            with get_dremio_pool().session() as pooled_session:
+                df_result = pooled_session.call(DREMIO_PROCEDURE, limited_sql)
+                if not is_query_result(df_result):
+                    raise ValueError("Unexpected result format from Dremio procedure")
+                span["rows"] = write_export(iter_result_batches(df_result), path, file_format)
+            span["bytes"] = os.path.getsize(path)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        _remove_file(path)
+
+def display_export_buttons(sql_statement: str, message_id: str) -> None:
+    """Download buttons that export the full result; the query runs only when one is clicked."""
+    st.caption(f"⬇️ Export the full result (up to {EXPORT_MAX_ROWS:,} rows)")
+    cols = st.columns(len(EXPORT_FORMATS))
+    for col, (label, (extension, mime)) in zip(cols, EXPORT_FORMATS.items()):
+        col.download_button(
+            label,
+            data=functools.partial(export_query_result, sql_statement, extension, st.session_state.session_id),
+            file_name=f"result_{message_id}.{extension}",
+            mime=mime,
+            key=f"export_{extension}_{message_id}",
+            on_click="ignore",
+            use_container_width=True,
+        )
+
+def create_visualization_with_tabs(
+    df: pd.DataFrame, sql_statement: str, message_id: str, data_sources: List[str] = None
+) -> None:
+    """Create visualization with data and chart tabs; widgets are keyed by the chat message."""
     if df.empty:
         st.info("📊 No data to visualize.")
         return
@@ -305,14 +2870,23 @@ def create_visualization_with_tabs(df: pd.DataFrame, sql_statement: str, data_so
             
             tab1, tab2 = st.tabs(["Data 📄", "Chart 📉"])
             
+            # Keyed by message: two turns can run the same SQL
             with tab1:
-                st.dataframe(df, use_container_width=True)
-                st.caption(f"📊 Showing {len(df)} rows × {len(df.columns)} columns")
+                server_grid = df.attrs.get("truncated") and st.toggle(
+                    "🗄️ Browse the full result in the warehouse",
+                    key=f"grid_mode_{message_id}",
+                    help="Page through every row, sorting and filtering in Dremio instead of in the browser."
+                )
+                if server_grid:
+                    display_result_grid(df, sql_statement, message_id)
+                else:
+                    st.dataframe(df, use_container_width=True)
+                    st.caption(f"📊 Showing {len(df)} rows × {len(df.columns)} columns")
+                    display_load_more(df, message_id)
+                display_export_buttons(sql_statement, message_id)
             
             with tab2:
-                # Use a stable hash from SQL statement as key
-                sql_hash = hashlib.md5(sql_statement.encode()).hexdigest()[:8]
-                display_charts_tab(df, sql_hash)
+                display_charts_tab(df, message_id)
             
             st.markdown('</div>', unsafe_allow_html=True)
             
@@ -366,6 +2940,65 @@ def extract_text_from_response(response_content: Dict) -> str:
     except Exception:
         return "Unable to extract response text."
 
+def serialize_context_message(message: ChatMessage, compact: bool = False) -> str:
+    """JSON for one chat message in Cortex Analyst's request format, memoized on the message.
+
+    Compact analyst turns fold their SQL into a short text summary.
+    """
+    mode = "compact" if compact else "full"
+    if message.context_json is None:
+        message.context_json = {}
+    cached = message.context_json
+    if mode in cached:
+        return cached[mode]
+    
+    if message.role == "user":
+        payload = {"role": "user", "content": [{"type": "text", "text": message.text}]}
+    else:
+        text = message.text
+        sql_statement = message.sql
+        if compact:
+            summary = text[:CONTEXT_COMPACT_CHARS]
+            if sql_statement:
+                summary += f"\n\nSQL used: {normalize_sql(sql_statement)[:CONTEXT_COMPACT_CHARS]}"
+            content = [{"type": "text", "text": summary}]
+        else:
+            content = [{"type": "text", "text": text}]
+            if sql_statement:
+                content.append({"type": "sql", "statement": sql_statement})
+        payload = {"role": "analyst", "content": content}
+    
+    cached[mode] = json.dumps(payload)
+    return cached[mode]
+
+def build_conversation_context(messages: List[ChatMessage]) -> List[str]:
+    """Serialized prior turns to send with the next question, newest first within the budget.
+
+    Only completed (user question, analyst answer) pairs are included so roles
+    alternate as Cortex Analyst requires. The latest answer keeps its SQL block
+    unless that alone exceeds the budget; older answers are compacted. Returns
+    the turns in chronological order.
+    """
+    pairs = []
+    for previous, message in zip(messages, messages[1:]):
+        if previous.role == "user" and message.role == "assistant" and message.message_id.startswith("msg_"):
+            pairs.append((previous, message))
+    
+    context: List[str] = []
+    used_chars = 0
+    for turn, (question, answer) in enumerate(reversed(pairs[-CONTEXT_MAX_TURNS:])):
+        fragments = [serialize_context_message(question), serialize_context_message(answer, compact=turn > 0)]
+        size = sum(len(fragment) for fragment in fragments)
+        if used_chars + size > CONTEXT_MAX_CHARS and turn == 0:
+            # A huge SQL block must not cost the follow-up all of its context
+            fragments[1] = serialize_context_message(answer, compact=True)
+            size = sum(len(fragment) for fragment in fragments)
+        if used_chars + size > CONTEXT_MAX_CHARS:
+            break
+        context[:0] = fragments
+        used_chars += size
+    return context
+
 def display_suggestions(suggestions: List[str], key_prefix: str = ""):
     """Display clickable suggestion buttons."""
     if not suggestions:
@@ -387,19 +3020,270 @@ def display_suggestions(suggestions: List[str], key_prefix: str = ""):
                 st.session_state.active_suggestion = suggestion
                 st.rerun()
 
+class QueryJob:
+    """A user question running on the query executor, with progress for the UI to poll."""
+
+    def __init__(self, question: str, owner: Optional[str] = None, context: Sequence[str] = ()):
+        self.question = question
+        self.owner = owner
+        self.context = context
+        self.stage = "queued"
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.stage_started_at: Dict[str, float] = {"queued": self.submitted_at}
+        self.response_content: Optional[Dict] = None
+        self.sql_statement: Optional[str] = None
+        self.df: Optional[pd.DataFrame] = None
+        self.snapshot: Optional[ResultSnapshot] = None
+        self.sql_error: Optional[str] = None
+        self.error: Optional[str] = None
+        self.future: Optional[Future] = None
+        self.ticket: Optional[SchedulerTicket] = None
+        self.statement_left_running = False
+        self._cancelled = threading.Event()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.submitted_at
+
+    @property
+    def done(self) -> bool:
+        return self.stage in ("done", "failed", "cancelled")
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def set_stage(self, stage: str) -> None:
+        if self.cancelled:
+            return
+        self.stage = stage
+        self.stage_started_at[stage] = time.time()
+        if self.done:
+            self.finished_at = time.time()
+
+    def cancel(self) -> None:
+        """Stop the job, cancelling its running statement where the session allows, and discard its results."""
+        if self.done:
+            return
+        self.set_stage("cancelled")
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+        ticket = self.ticket
+        if ticket is not None and ticket.state == "running" and not ticket.cancel_statement():
+            # Shared sessions cannot be cancelled; the worker stops once the statement returns
+            self.statement_left_running = True
+
+@st.cache_resource
+def get_query_executor() -> ThreadPoolExecutor:
+    """Process-wide thread pool that runs Cortex Analyst and Dremio calls off the script thread."""
+    return ThreadPoolExecutor(max_workers=QUERY_WORKER_THREADS, thread_name_prefix="query")
+
+def run_query_job(job: QueryJob) -> None:
+    """Worker body: ask Cortex Analyst, then run any generated SQL. Must not touch st.* UI."""
+    with warehouse_request(job.owner, PRIORITY_INTERACTIVE, job=job):
+        try:
+            job.set_stage("analyzing")
+            response_content, error = get_analyst_response(job.question, job.context)
+            if job.cancelled:
+                return
+            if error:
+                raise Exception(f"Cortex Analyst Error: {error}")
+            if not response_content or not isinstance(response_content, dict):
+                raise Exception("❌ Invalid or empty response from Cortex Analyst")
+            job.response_content = response_content
+            
+            with timed_span("sql_extract"):
+                job.sql_statement = extract_sql_from_response(response_content)
+            if job.sql_statement:
+                job.set_stage("executing")
+                job.df, job.sql_error = fetch_query_result(job.sql_statement, owner=job.owner)
+                if job.cancelled:
+                    return
+                if job.df is not None:
+                    job.snapshot = ResultSnapshot.from_dataframe(job.df)
+            
+            job.set_stage("done")
+        except Exception as e:
+            job.error = str(e)
+            job.set_stage("failed")
+
+def submit_query_job(question: str, context: Sequence[str] = ()) -> QueryJob:
+    """Queue question on the executor and return its job handle."""
+    job = QueryJob(question, owner=st.session_state.session_id, context=context)
+    job.future = get_query_executor().submit(run_query_job, job)
+    return job
+
+def finalize_query_job(job: QueryJob) -> None:
+    """Move a finished job's outcome into the chat history."""
+    position = len(st.session_state.messages)
+    if job.stage == "done":
+        message = ChatMessage.from_response(
+            job.response_content, f"msg_{position}", result=job.snapshot, sql_error=job.sql_error
+        )
+    elif job.stage == "cancelled":
+        text = "⏹️ Request cancelled."
+        if job.statement_left_running:
+            text += " The statement already running in the warehouse will finish in the background."
+        message = ChatMessage.assistant(text, f"cancelled_{position}")
+    else:
+        message = ChatMessage.assistant(f"❌ Error: {job.error}", f"error_{position}")
+    
+    st.session_state.messages.append(message)
+    enforce_snapshot_budget(st.session_state.messages)
+    enforce_history_budget(st.session_state.messages)
+    if job.stage == "done":
+        prefetch_suggestions(job.response_content)
+    
+    st.session_state.active_job = None
+    st.session_state.processing = False
+    st.session_state.loading_start_time = None
+
+class SuggestionPrefetcher:
+    """Runs suggested follow-up questions in the background so a click is answered from cache.
+
+    Work is limited to ``concurrency`` threads and ``daily_budget`` warehouse calls
+    per day across the process. Each owner (browser session) has a generation
+    counter; bumping it cancels that owner's queued prefetches.
+    """
+
+    def __init__(self, concurrency: int, daily_budget: int):
+        self.daily_budget = daily_budget
+        self.prefetched = 0
+        self.cancelled = 0
+        self.over_budget = 0
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="prefetch")
+        self._generations: Dict[str, int] = {}
+        self._pending: Dict[str, List[Tuple[str, Future]]] = {}
+        self._budget_day = datetime.now().date()
+        self._budget_used = 0
+        self._lock = threading.Lock()
+
+    def schedule(self, owner: str, questions: List[str], context: Sequence[str]) -> None:
+        """Queue questions for owner, replacing anything it still had queued."""
+        self.cancel(owner)
+        with self._lock:
+            generation = self._generations.get(owner, 0)
+            self._pending[owner] = [
+                (question, self._executor.submit(self._run, owner, generation, question, tuple(context)))
+                for question in questions
+            ]
+
+    def cancel(self, owner: str, keep: Optional[str] = None) -> None:
+        """Drop owner's queued prefetches, except one already fetching the question in keep."""
+        with self._lock:
+            self._generations[owner] = self._generations.get(owner, 0) + 1
+            for question, future in self._pending.pop(owner, []):
+                if question != keep and future.cancel():
+                    self.cancelled += 1
+
+    def budget_used(self) -> int:
+        with self._lock:
+            self._roll_budget_day()
+            return self._budget_used
+
+    def _charge(self) -> bool:
+        with self._lock:
+            self._roll_budget_day()
+            if self._budget_used >= self.daily_budget:
+                self.over_budget += 1
+                return False
+            self._budget_used += 1
+            return True
+
+    def _roll_budget_day(self) -> None:
+        today = datetime.now().date()
+        if today != self._budget_day:
+            self._budget_day = today
+            self._budget_used = 0
+
+    def _is_current(self, owner: str, generation: int) -> bool:
+        with self._lock:
+            return self._generations.get(owner) == generation
+
+    def _run(self, owner: str, generation: int, question: str, context: Tuple[str, ...]) -> None:
+        with warehouse_request(owner, PRIORITY_BACKGROUND):
+            self._prefetch(owner, generation, question, context)
+
+    def _prefetch(self, owner: str, generation: int, question: str, context: Tuple[str, ...]) -> None:
+        if not self._is_current(owner, generation):
+            return
+        if response_cache_key(question, context) not in get_response_cache() and not self._charge():
+            return
+        response_content, error = get_analyst_response(question, context)
+        if error or not response_content:
+            return
+        
+        sql_statement = extract_sql_from_response(response_content)
+        if sql_statement and PREFETCH_RUN_SQL and self._is_current(owner, generation):
+            if result_cache_key(sql_statement) not in get_result_cache() and not self._charge():
+                return
+            fetch_query_result(sql_statement, owner=owner)
+        with self._lock:
+            self.prefetched += 1
+
+@st.cache_resource
+def get_prefetcher() -> SuggestionPrefetcher:
+    """Process-wide suggestion prefetcher."""
+    return SuggestionPrefetcher(PREFETCH_CONCURRENCY, PREFETCH_DAILY_BUDGET)
+
+def prefetch_suggestions(response_content: Optional[Dict]) -> None:
+    """If this session opted in, start prefetching the top suggestions of the latest answer."""
+    if not st.session_state.prefetch_enabled or not response_content:
+        return
+    suggestions = extract_suggestions_from_response(response_content)[:PREFETCH_TOP_N]
+    if suggestions:
+        # Same context the follow-up question will carry, so a click hits the cache
+        context = build_conversation_context(st.session_state.messages)
+        get_prefetcher().schedule(st.session_state.session_id, suggestions, context)
+
+@st.fragment
+def display_message_result(message: ChatMessage, sql_statement: str) -> None:
+    """Render a history message's data and charts; widget changes rerun only this fragment."""
+    # Historical results come from the shared cache or the message snapshot
+    if message.sql_error:
+        df, sql_error = None, message.sql_error
+    else:
+        with warehouse_request(st.session_state.session_id, PRIORITY_HISTORY):
+            df, sql_error = load_message_result(message, sql_statement)
+    
+    if df is not None and not df.empty:
+        data_sources = identify_data_sources_from_sql(sql_statement)
+        create_visualization_with_tabs(df, sql_statement, message.message_id, data_sources)
+    elif sql_error:
+        st.error(f"❌ **SQL Execution Error:** {sql_error}")
+
+def describe_message_result(message: ChatMessage) -> str:
+    """One-line label for a collapsed history result."""
+    if message.sql_error:
+        return "⚠️ Show query error"
+    snapshot = message.result
+    if snapshot is None:
+        return "📊 Show data & charts"
+    more = "+" if snapshot.truncated else ""
+    return f"📊 Show data & charts ({snapshot.rows:,}{more} rows)"
+
 def process_user_question(question: str):
     """Process user question and generate response."""
+    # A new question supersedes speculative work for the previous answer
+    get_prefetcher().cancel(st.session_state.session_id, keep=question)
+    
+    # Prior turns, built before the new question joins the history
+    context = build_conversation_context(st.session_state.messages)
+    
+    st.session_state.processing = True
+    st.session_state.loading_start_time = time.time()
+    
+    # Add user message to chat
+    st.session_state.messages.append(ChatMessage.user(question, f"user_{len(st.session_state.messages)}"))
+    
+    if ASYNC_EXECUTION:
+        # Warehouse calls run on a worker; render_chat_interface polls the job
+        st.session_state.active_job = submit_query_job(question, context)
+        return
+    
     try:
-        st.session_state.processing = True
-        st.session_state.loading_start_time = time.time()
-        
-        # Add user message to chat
-        st.session_state.messages.append({
-            "role": "user",
-            "content": question,
-            "timestamp": datetime.now()
-        })
-        
         # Display user message
         with st.chat_message("user"):
             st.markdown(question)
@@ -411,7 +3295,8 @@ def process_user_question(question: str):
         with loading_placeholder:
             with st.spinner("🤔 Analyzing your question..."):
                 # Get AI response
-                response_content, error = call_cortex_analyst_procedure(question)
+                with warehouse_request(st.session_state.session_id, PRIORITY_INTERACTIVE):
+                    response_content, error = get_analyst_response(question, context)
                 
                 if error:
                     raise Exception(f"Cortex Analyst Error: {error}")
@@ -430,18 +3315,27 @@ def process_user_question(question: str):
                 st.markdown(text_content)
             
             # Extract and execute SQL if present
-            sql_statement = extract_sql_from_response(response_content)
+            snapshot = None
+            sql_error = None
+            message_id = f"msg_{len(st.session_state.messages)}"
+            with timed_span("sql_extract"):
+                sql_statement = extract_sql_from_response(response_content)
             if sql_statement:
                 # Show another loading message for SQL execution
                 with st.spinner("🔄 Executing query and creating visualization..."):
-                    df, sql_error = call_dremio_data_procedure(sql_statement)
+                    with warehouse_request(st.session_state.session_id, PRIORITY_INTERACTIVE):
+                        df, sql_error = fetch_query_result(
+                            sql_statement, owner=st.session_state.session_id, max_rows=get_row_limit(message_id)
+                        )
                     
                     if df is not None:
+                        snapshot = ResultSnapshot.from_dataframe(df)
+                        
                         # Identify data sources
                         data_sources = identify_data_sources_from_sql(sql_statement)
                         
                         # Create visualization with tabs
-                        create_visualization_with_tabs(df, sql_statement, data_sources)
+                        create_visualization_with_tabs(df, sql_statement, message_id, data_sources)
                         
                     elif sql_error:
                         st.error(f"❌ **SQL Execution Error:** {sql_error}")
@@ -451,27 +3345,24 @@ def process_user_question(question: str):
             # Display suggestions
             suggestions = extract_suggestions_from_response(response_content)
             if suggestions:
-                display_suggestions(suggestions, f"msg_{len(st.session_state.messages)}")
+                display_suggestions(suggestions, message_id)
         
         # Add assistant message to chat history
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": response_content,
-            "timestamp": datetime.now(),
-            "message_id": f"msg_{len(st.session_state.messages)}"
-        })
+        st.session_state.messages.append(ChatMessage.from_response(
+            response_content, message_id, result=snapshot, sql_error=sql_error
+        ))
+        enforce_snapshot_budget(st.session_state.messages)
+        enforce_history_budget(st.session_state.messages)
+        prefetch_suggestions(response_content)
         
     except Exception as e:
         error_message = f"❌ Error: {str(e)}"
         st.error(error_message)
         
         # Add error message to chat history
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": {"message": {"content": [{"type": "text", "text": error_message}]}},
-            "timestamp": datetime.now(),
-            "message_id": f"error_{len(st.session_state.messages)}"
-        })
+        st.session_state.messages.append(
+            ChatMessage.assistant(error_message, f"error_{len(st.session_state.messages)}")
+        )
         
     finally:
         st.session_state.processing = False
@@ -480,24 +3371,23 @@ def process_user_question(question: str):
 def send_welcome_message():
     """Send welcome message to get initial suggestions."""
     if not st.session_state.chat_initialized:
-        # Show initial loading
+        # Precomputed once per process; only the very first session waits here
         with st.spinner("🚀 Initializing chat assistant..."):
-            welcome_query = "What questions can I ask? Help me get started."
-            response_content, error = call_cortex_analyst_procedure(welcome_query)
+            response_content = get_welcome_service().get(timeout=WELCOME_WAIT_SECONDS)
             
-            if response_content and not error:
+            if response_content:
                 # Store welcome message
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response_content,
-                    "timestamp": datetime.now(),
-                    "message_id": "welcome"
-                })
+                st.session_state.messages.append(ChatMessage.from_response(response_content, "welcome"))
         
         st.session_state.chat_initialized = True
 
 def render_chat_interface():
     """Render the main chat interface."""
+    # Move a finished background job into the chat history
+    job = st.session_state.active_job
+    if job is not None and job.done:
+        finalize_query_job(job)
+    
     # Handle pending question first
     if st.session_state.get("pending_question") and not st.session_state.processing:
         question = st.session_state.pending_question
@@ -516,39 +3406,38 @@ def render_chat_interface():
     st.title("🤖 NLP-Based Dashboard's with Data")
     st.markdown("Let's get started, Ask questions about your data in natural language!")
     
+    # Only the most recent answers materialize their data and charts up front
+    assistant_indices = [i for i, m in enumerate(st.session_state.messages) if m.role == "assistant"]
+    expanded_from = assistant_indices[-RECENT_TURNS_EXPANDED] if len(assistant_indices) >= RECENT_TURNS_EXPANDED else 0
+    
     # Display existing chat messages
     for i, message in enumerate(st.session_state.messages):
-        message_id = message.get("message_id", f"msg_{i}")
-        
-        if message["role"] == "user":
+        if message.role == "user":
             with st.chat_message("user"):
-                st.markdown(message["content"])
+                st.markdown(message.text)
                 
-        elif message["role"] == "assistant":
+        elif message.role == "assistant":
             with st.chat_message("assistant"):
-                response_content = message["content"]
-                
                 # Display text response
-                text_content = extract_text_from_response(response_content)
-                if text_content:
-                    st.markdown(text_content)
+                if message.text:
+                    st.markdown(message.text)
                 
-                # Extract and show SQL + visualization if present
-                sql_statement = extract_sql_from_response(response_content)
+                # Show SQL + visualization if present
+                sql_statement = message.sql
                 if sql_statement:
-                    # Re-execute query for historical messages (in production, consider caching)
-                    df, sql_error = call_dremio_data_procedure(sql_statement)
-                    
-                    if df is not None and not df.empty:
-                        data_sources = identify_data_sources_from_sql(sql_statement)
-                        create_visualization_with_tabs(df, sql_statement, data_sources)
-                    elif sql_error:
-                        st.error(f"❌ **SQL Execution Error:** {sql_error}")
+                    if i >= expanded_from:
+                        display_message_result(message, sql_statement)
+                    elif st.toggle(describe_message_result(message), key=f"expand_{message.message_id}"):
+                        display_message_result(message, sql_statement)
                 
                 # Display suggestions
-                suggestions = extract_suggestions_from_response(response_content)
-                if suggestions:
-                    display_suggestions(suggestions, f"msg_{i}")
+                if message.suggestions:
+                    display_suggestions(list(message.suggestions), f"msg_{i}")
+    
+    # Live progress for a question running in the background
+    if st.session_state.active_job is not None:
+        with st.chat_message("assistant"):
+            display_dynamic_spinner(st.session_state.active_job)
     
     # Chat input - disabled during processing
     question = st.chat_input(
@@ -566,9 +3455,63 @@ def render_chat_interface():
 
 def main():
     """Main Streamlit application."""
+    startup_report = get_startup_report()
+    started = time.perf_counter()
+    with timed_span("rerun"):
+        run_app()
+    # Only the first run of the process lands in the report
+    startup_report.record("first page", time.perf_counter() - started)
+
+def display_performance_panel():
+    """Sidebar panel with per-stage latency percentiles and metric exports."""
+    metrics = get_metrics()
+    with st.expander("⏱️ Performance", expanded=False):
+        summary = metrics.summary()
+        if summary:
+            st.dataframe(pd.DataFrame(summary).set_index("stage"), use_container_width=True)
+        else:
+            st.caption("No timings recorded yet.")
+        
+        gauges = {
+            "cache_hits": {name: cache.stats()["hits"] for name, cache in metric_caches().items()},
+            "cache_misses": {name: cache.stats()["misses"] for name, cache in metric_caches().items()},
+            "cache_bytes": {name: cache.stats()["bytes"] for name, cache in metric_caches().items()},
+            "cache_invalidations": {name: cache.stats()["invalidations"] for name, cache in metric_caches().items()},
+            "table_freshness": get_freshness_monitor().stats(),
+            "pool_in_use": {pool.name: pool.stats()["in_use"] for pool in (get_cortex_pool(), get_dremio_pool())},
+            "pool_avg_wait_ms": {pool.name: round(pool.stats()["avg_wait_ms"], 3) for pool in (get_cortex_pool(), get_dremio_pool())},
+            "coalesced_calls": {name: flight.stats()["coalesced"] for name, flight in get_single_flights().items()},
+            "scheduler": get_scheduler().stats(),
+            "startup_phase_seconds": {row["phase"]: row["duration_ms"] / 1000 for row in get_startup_report().rows()},
+        }
+        coalesced = gauges["coalesced_calls"]
+        st.caption(f"🔗 Coalesced calls: Cortex {coalesced['cortex']} • Dremio {coalesced['dremio']}")
+        startup = get_startup_report().rows()
+        if startup:
+            st.markdown("**🚀 Startup**")
+            st.dataframe(startup, hide_index=True, use_container_width=True)
+        col1, col2 = st.columns(2)
+        col1.download_button("JSON lines", metrics.export_jsonl(), file_name="spans.jsonl", mime="application/x-ndjson")
+        col2.download_button("Prometheus", metrics.export_prometheus(gauges), file_name="metrics.prom", mime="text/plain")
+
+def metric_caches() -> Dict[str, LRUCache]:
+    """Caches whose counters are exported with the performance metrics."""
+    return {
+        "result": get_result_cache(),
+        "response": get_response_cache(),
+        "chart": get_chart_cache(),
+        "profile": get_profile_cache(),
+        "grid": get_grid_page_cache(),
+    }
+
+def run_app():
+    """Render one run of the app."""
     # Initialize session state
     initialize_session_state()
     
+    # Start precomputing the shared welcome message (no-op after the first run)
+    get_welcome_service()
+    
     # Send welcome message on first load
     send_welcome_message()
     
@@ -580,10 +3523,21 @@ def main():
         st.header("🛠️ Chat Controls")
         
         if st.button("🗑️ Clear Chat History", use_container_width=True, disabled=st.session_state.processing):
+            for message in st.session_state.messages:
+                if message.result is not None:
+                    message.result.discard()
             st.session_state.messages = []
             st.session_state.chat_initialized = False
             st.rerun()
         
+        st.toggle(
+            "⚡ Prefetch suggested questions",
+            key="prefetch_enabled",
+            help="Answer the top suggestions in the background so clicking one is instant."
+        )
+        if st.session_state.prefetch_enabled:
+            st.caption(f"Prefetch budget today: {get_prefetcher().budget_used()}/{PREFETCH_DAILY_BUDGET} calls")
+        
         st.markdown("---")
         st.markdown("### 📊 Features")
         st.markdown("""
@@ -599,6 +3553,22 @@ def main():
             st.markdown("---")
             st.markdown(f"**Messages:** {len(st.session_state.messages)}")
             st.markdown(f"**Status:** {'Processing...' if st.session_state.processing else 'Ready'}")
+        
+        response_stats = get_response_cache().stats()
+        st.caption(f"🧠 Answer cache: {response_stats['hits']} hits • {response_stats['misses']} misses")
+        scheduler_stats = get_scheduler().stats()
+        st.caption(
+            f"🚦 Warehouse calls: {scheduler_stats['running']}/{SCHEDULER_MAX_CONCURRENCY} running • "
+            f"{scheduler_stats['queued']} queued • {scheduler_stats['rejected']} rejected"
+        )
+        for pool in (get_cortex_pool(), get_dremio_pool()):
+            pool_stats = pool.stats()
+            st.caption(
+                f"🔌 {pool.name} pool: {pool_stats['in_use']}/{pool_stats['max_size']} in use • "
+                f"avg wait {pool_stats['avg_wait_ms']:.0f} ms"
+            )
+        
+        display_performance_panel()
 
 if __name__ == "__main__":
     main()